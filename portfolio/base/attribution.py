@@ -0,0 +1,96 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import numpy as np
+import pandas as pd
+from datetime import date
+from pandas.tseries.offsets import CDay
+
+from .nav import NavEngine
+
+ATTRIBUTION_columns = ['amount', '%', 'start_amt', 'mvmts', 'pnl', 'perf', 'perfAttr']
+
+class AttributionEngine :
+
+    def __init__(self, navEngine:NavEngine) :
+        """
+        Performance attribution per asset class of a batch of (start, end)
+        windows in one pass : values of every start and end date, movements
+        valued at the prices of the start and external cash flows, without
+        moving the pricing date of the portfolio or the securities
+        :parameters:
+            navEngine : NavEngine,
+                Valuation of the positions and cash flows for arrays of dates
+
+        :methods:
+            standardWindows : D-1, MTD, QTD and YTD windows of a date
+
+            attribution : start and end values, movements, pnl, performance
+                and contribution per (window, asset class)
+        """
+        self._navEngine = navEngine
+
+    @staticmethod
+    def standardWindows(pricing_dt:date) -> dict :
+        """
+        Windows ending on pricing_dt and starting on the business day before
+        the date, the month, the quarter and the year
+        """
+        quarter = date(pricing_dt.year, 3 * ((pricing_dt.month - 1) // 3) + 1, 1)
+        starts = {'D-1' : pricing_dt,
+                  'MTD' : date(pricing_dt.year, pricing_dt.month, 1),
+                  'QTD' : quarter,
+                  'YTD' : date(pricing_dt.year, 1, 1)}
+
+        return {k : ((v - CDay(1)).date(), pricing_dt) for k, v in starts.items()}
+
+    def attribution(self, windows:dict) -> pd.DataFrame :
+        """
+        Attribution of windows (name : (start_dt, end_dt)), indexed by
+        (window, asset_class) with cash last :
+            amount, % : value and weight at the end
+            start_amt : value at the start
+            mvmts : trades of the window at the prices of the start (cash
+                gets their opposite plus the external cash flows)
+            pnl, perf, perfAttr : pnl, performance and contribution
+        """
+        names = list(windows)
+        starts = [windows[x][0] for x in names]
+        ends = [windows[x][1] for x in names]
+        dates = pd.Index(sorted(set(starts) | set(ends)))
+        s = dates.get_indexer(starts)
+        e = dates.get_indexer(ends)
+
+        ids, quantity, unit, codes, asset_classes = self._navEngine.unitValues(list(dates))
+
+        # Asset classes sorted as the snapshots breakdowns, cash last
+        order = np.argsort(np.asarray(asset_classes, dtype=str))
+        codes = np.where(codes >= 0, np.argsort(order)[np.maximum(codes, 0)], -1)
+        classes = list(np.asarray(asset_classes)[order]) + ['cash']
+
+        n = order.shape[0]
+        values = np.column_stack([NavEngine.byClass(quantity * unit, codes, n),
+                                  self._navEngine.cashValues(list(dates))])
+        mvmts = NavEngine.byClass((quantity[e] - quantity[s]) * unit[s], codes, n)
+        mvmts = np.column_stack([mvmts, self._navEngine.flowValues(starts, ends) - mvmts.sum(axis=1)])
+
+        amount = values[e]
+        start_amt = values[s]
+        pnl = amount - mvmts - start_amt
+        with np.errstate(invalid='ignore', divide='ignore') :
+            weight = amount / amount.sum(axis=1, keepdims=True)
+            perf = pnl / start_amt
+        perf[np.isinf(perf)] = 0
+
+        table = pd.DataFrame({'amount' : amount.ravel(), '%' : weight.ravel(),
+                              'start_amt' : start_amt.ravel(), 'mvmts' : mvmts.ravel(),
+                              'pnl' : pnl.ravel(), 'perf' : perf.ravel(),
+                              'perfAttr' : (perf * weight).ravel()},
+                             index=pd.MultiIndex.from_product([names, classes],
+                                                              names=['window', 'asset_class']))
+
+        # Asset classes without value nor movements in a window are dropped
+        held = (table[['amount', 'start_amt', 'mvmts']] != 0).any(axis=1)
+        held |= table.index.get_level_values('asset_class') == 'cash'
+
+        return table.loc[held, ATTRIBUTION_columns]
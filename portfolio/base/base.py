@@ -1,14 +1,26 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
+import copy
 import numpy as np
 import pandas as pd
 import matplotlib.pyplot as plt
+from collections import OrderedDict
 
 from datetime import datetime as dt
 from datetime import date
 
-from ..utils.utils import interpolate
+from ..options import OptionBook
+from .positions import PositionsIndex
+from .nav import NavEngine
+from .attribution import AttributionEngine
+from .snapshot import PortfolioSnapshot
+from .ladder import CashFlowLadder
+from .risk import RiskCube
+from .scenarios import ScenarioEngine
+from ..utils.graph import DependencyGraph
+
+SNAPSHOT_cache = 32 # dates kept in the snapshots LRU
 
 class BasePortfolio:
 
@@ -75,79 +87,188 @@ class BasePortfolio:
         self._pricing_dt = initial_pricing_date
         self._securities = securities
 
-        self._blotter = self._add_column(blotters['blotter'], 'currency', self._securities)
+        self._blotter = self._intern(blotters['blotter'])
         self._cash_blotter = blotters['cash_blotter']
+        self._positions = PositionsIndex(self._blotter, self._cash_blotter)
+        self._navEngine = NavEngine(self._securities, self._positions)
+        self._attribution = AttributionEngine(self._navEngine)
+
+        self._snapshots = OrderedDict()
+        self._market = None
+        self._graph = DependencyGraph()
+        self._graph.addNode('positions', self._updatePositions)
+        self._graph.addNode('market', self._updateMarket)
+        self._graph.addNode('breakdowns', self._updateBreakdowns, ['positions', 'market'])
 
         print('\rUpdating portfolio...', flush=True)
         self.basePort()
-
-        print('\rCalcuating Sub Portfolios...', flush=True)
-        self._bonds = Bonds(self._port[self._port['asset_class'] == 'bond'], self._securities)
-        self._equities = self._port[self.port['asset_class'] == 'equities']
-        _options = self._port[self.port['asset_class'] == 'options']
-        if not _options.empty :
-            _options['Option'] = _options.index.map(self._securities.options['Option'])
-            self._options = Options(_options, self._securities)
         
         print('\rDone...', flush=True)
         
     def totalUpdate(self) :
-        self.updatePort()
-        self.updateCash()
-        self._breakdowns()
+        self._graph.invalidate('positions', 'market')
+        self.refresh()
+    
+    def refresh(self) -> list[str] :
+        """
+        Recomputes only what changed since the last update : positions (new
+        trades or pricing date) and / or market (any input of the securities)
+        """
+        if self._securities.version != self._market :
+            self._graph.invalidate('market')
+        return self._graph.refresh()
+    
+    def _updatePositions(self) :
+        self._holdings = self._positions.positions(self._pricing_dt)
+        self._cashHoldings = self._positions.cash(self._pricing_dt)
+    
+    def _updateMarket(self) :
+        self._market = self._securities.version
+    
+    def _updateBreakdowns(self) :
+        key = self._snapshotKey(self._pricing_dt)
+        if key in self._snapshots :
+            snapshot = self._snapshots[key]
+            self._snapshots.move_to_end(key)
+        else :
+            snapshot = self._cache(key, self._valuation(self._holdings, self._cashHoldings))
+        
+        self._port = snapshot.port
+        self._cash = snapshot.cash
+        self._currencies = snapshot.currencies
+        self._assets = snapshot.assets
+        self._snapshot = snapshot
     
     def basePort(self) :
         self._pricing_dt = self._basePricing_dt
         self._securities.pricing_dt = self._basePricing_dt
         self.totalUpdate()
     
-    def updatePort(self) :
+    def snapshot(self, pricing_dt:date=None) -> PortfolioSnapshot :
         """
-        Update Portfolio using pricing_dt as a reference for pricing and calculations
+        Valuation of the portfolio on pricing_dt (default the current pricing
+        date), cached by date in a bounded LRU. Dates other than the current
+        one are valued without moving the pricing date of the portfolio
         """
-        blotter = self._blotter.loc[self._blotter['date'] <= self._pricing_dt]
-        blotter['auxPrice'] = blotter['cost_price'] * blotter['quantity']
-        port = blotter.groupby('id').sum(numeric_only=True)
-        port['cost_price'] = port['auxPrice'] / port['quantity']
+        pricing_dt = self._pricing_dt if pricing_dt is None else pricing_dt
+        key = self._snapshotKey(pricing_dt)
+        if key in self._snapshots :
+            self._snapshots.move_to_end(key)
+            return self._snapshots[key]
         
-        port['asset_class'] = port.index.map(self._securities.id_all['asset_class'])
-        port['price'] = port.index.map(self._securities.id_all['price'])
-        port['currency'] = port.index.map(self._securities.id_all['currency'])
-        port['ccy_price'] = port['currency'].map(self._securities.fx['price'])
+        if self._securities.pricing_dt != pricing_dt :
+            self._securities.pricing_dt = pricing_dt
+            snapshot = self._valuation()
+            self._securities.pricing_dt = self._pricing_dt
+        else :
+            snapshot = self._valuation()
+        
+        return self._cache(key, snapshot)
+    
+    def _snapshotKey(self, pricing_dt:date) -> tuple :
+        # Inputs set on the securities (prices, curves...) are kept per date
+        return (pricing_dt, self._securities.inputs(pricing_dt))
+    
+    def _cache(self, key:tuple, snapshot:PortfolioSnapshot) -> PortfolioSnapshot :
+        self._snapshots[key] = snapshot
+        if len(self._snapshots) > SNAPSHOT_cache :
+            self._snapshots.popitem(last=False)
+        
+        return snapshot
+    
+    def clearSnapshots(self) :
+        self._snapshots.clear()
+    
+    def _valuation(self, holdings:pd.DataFrame=None, cash:pd.DataFrame=None) -> PortfolioSnapshot :
+        """
+        Values the portfolio with the securities as currently priced
+        (holdings and cash default to the positions on that date)
+        """
+        pricing_dt = self._securities.pricing_dt
+        port = self._portAt(pricing_dt, holdings)
+        cash = self._cashAt(pricing_dt, cash)
+        currencies, assets = self._breakdowns(port, cash)
+        
+        return PortfolioSnapshot(pricing_dt, port, cash, currencies, assets,
+                                 self._securities.master.prices,
+                                 self._securities.fx['price'].copy(),
+                                 self._marketState(port),
+                                 self._subportfolio)
+    
+    def _marketState(self, port:pd.DataFrame) -> dict :
+        """
+        Market state of the held bonds and options frozen with a snapshot :
+        the bonds in their own BondBook, copies of the Option objects and
+        the vol surface of the date
+        """
+        book = self._securities.bondBook
+        rows = book.ids.get_indexer(port.index[port['asset_class'] == 'bond'])
+        ids = port.index[port['asset_class'] == 'options']
+        options = self._securities.options['Option'].reindex(ids).dropna()
+        
+        return {'bonds' : book.copy(rows[rows >= 0]),
+                'options' : options.map(copy.copy),
+                'volatilities' : self._securities.volatilities.interpolator if options.shape[0] > 0 else None}
+    
+    def _subportfolio(self, snapshot:PortfolioSnapshot, name:str) :
+        """
+        Builds the bonds, equities or options subportfolio of a snapshot
+        (first access only) from the market state frozen with it
+        """
+        port = snapshot.port
+        market = snapshot.market
+        if name == 'bonds' :
+            return Bonds(port[port['asset_class'] == 'bond'], self._securities, market['bonds'],
+                         self._positions.accounts(snapshot.pricing_dt), snapshot.pricing_dt)
+        if name == 'equities' :
+            return port[port['asset_class'] == 'equities']
+        
+        options = port[port['asset_class'] == 'options']
+        if options.empty :
+            return None
+        options['Option'] = market['options']
+        return Options(options, market['volatilities'])
+    
+    def _portAt(self, pricing_dt:date, holdings:pd.DataFrame=None) -> pd.DataFrame :
+        """
+        Positions on pricing_dt valued with the current prices
+        """
+        port = self._positions.positions(pricing_dt) if holdings is None else holdings.copy()
+        
+        master = self._securities.master
+        sids = master.sid(port.index)
+        port['asset_class'] = np.asarray(master.take('asset_class', sids))
+        port['price'] = master.take('price', sids)
+        port['currency'] = np.asarray(master.take('currency', sids))
+        port['ccy_price'] = self._securities.fxEngine.rates(port['currency'])
         
         port['mtm'] = port['quantity'] * port['price'] / port['ccy_price']
         
-        self._port = port[['quantity', 'cost_price', 'price', 'currency',  'ccy_price', 'mtm', 'asset_class']]
+        return port[['quantity', 'cost_price', 'price', 'currency',  'ccy_price', 'mtm', 'asset_class']]
                 
-    def updateCash(self):
+    def _cashAt(self, pricing_dt:date, cash:pd.DataFrame=None) -> pd.DataFrame :
         """
-        Update Cash using pricing_dt as a reference for pricing and calculations
+        Cash on pricing_dt valued with the current fx prices
         """
-        cash_blotter = self._cash_blotter.loc[self._cash_blotter['date'] <= self._pricing_dt]
-        blotter = self._blotter.loc[self._blotter['date'] <= self._pricing_dt]
-
-        blotter['cash_mvmt'] = -blotter['quantity'] * blotter['cost_price'] 
-        blotter_cash = blotter.groupby('currency').sum(numeric_only=True)
-
-        cash = cash_blotter.groupby('currency').sum(numeric_only=True)
-        cash.loc[:, 'amount'] = cash.loc[:, 'amount'].add(blotter_cash.loc[:, 'cash_mvmt'], fill_value=0)
-        cash['ccy_price'] = cash.index.map(self._securities.fx['price'])
+        cash = self._positions.cash(pricing_dt) if cash is None else cash.copy()
+        cash['ccy_price'] = self._securities.fxEngine.rates(cash.index)
         cash['mtm'] = cash['amount'] / cash['ccy_price']
         
-        self._cash = cash
+        return cash
 
-    def _breakdowns(self):
+    @staticmethod
+    def _breakdowns(port:pd.DataFrame, cash:pd.DataFrame) -> tuple :
         """
-        Update Breakdowns using current Portfolio
+        Currencies and asset class breakdowns of a portfolio and its cash
         """
-        if self._port.shape[0] > 0 :
-            x = self._port.groupby('currency').sum(numeric_only=True)['mtm'].to_dict()
-            y = self._cash['mtm'].to_dict()
+        if port.shape[0] > 0 :
+            x = port.groupby('currency').sum(numeric_only=True)['mtm'].to_dict()
+            y = cash['mtm'].to_dict()
             ccy = {k: x.get(k, 0) + y.get(k, 0) for k in set(x) | set(y)}
             
-            asset = self._port.groupby('asset_class').sum(numeric_only=True)['mtm'].to_dict()
+            asset = port.groupby('asset_class').sum(numeric_only=True)['mtm'].to_dict()
         else :
-            ccy = self._cash['mtm'].to_dict()
+            ccy = cash['mtm'].to_dict()
             asset = {}
             
         #CURRENCY BREAKDOWN    
@@ -155,14 +276,59 @@ class BasePortfolio:
                                         orient='index',
                                         columns=['amount'])
         currencies['%'] = currencies['amount'] / currencies['amount'].sum()
-        self._currencies = currencies.sort_values(by='%', ascending=False)
+        currencies = currencies.sort_values(by='%', ascending=False)
 
         #ASSET BREAKDOWN
-        asset['cash'] = self._cash['mtm'].sum()
+        asset['cash'] = cash['mtm'].sum()
         assets = pd.DataFrame.from_dict(asset, orient='index', columns=['amount'])
         assets['%'] = assets['amount'] / assets['amount'].sum()
-        self._assets = assets
+        
+        return currencies, assets
 
+    def addTrade(self, _id:str, trade_dt:date, quantity:float, cost_price:float, account:str=None) :
+        """
+        Appends a trade to the blotter and the positions index
+        """
+        trade = self._intern(pd.DataFrame({'date' : [trade_dt], 'quantity' : [quantity],
+                                           'cost_price' : [cost_price], 'account' : [account]},
+                                          index=pd.Index([_id], name=self._blotter.index.name)))
+        currency = trade['currency'].iloc[0]
+        self._blotter = pd.concat([self._blotter, trade])
+        self._positions.addTrade(_id, trade_dt, quantity, cost_price, currency, account)
+        self.clearSnapshots()
+        if trade_dt <= self._pricing_dt :
+            self._graph.invalidate('positions')
+            self.refresh()
+    
+    def addCash(self, currency:str, cash_dt:date, amount:float, account:str=None) :
+        """
+        Appends a cash movement to the cash blotter and the positions index
+        """
+        movement = pd.DataFrame({'date' : [cash_dt], 'amount' : [amount], 'account' : [account]},
+                                index=pd.Index([currency], name=self._cash_blotter.index.name))
+        self._cash_blotter = pd.concat([self._cash_blotter, movement])
+        self._positions.addCash(currency, cash_dt, amount)
+        self.clearSnapshots()
+        if cash_dt <= self._pricing_dt :
+            self._graph.invalidate('positions')
+            self.refresh()
+    
+    @property
+    def positions(self) :
+        return self._positions
+    
+    @property
+    def graph(self) :
+        return self._graph
+    
+    @property
+    def navEngine(self) :
+        return self._navEngine
+    
+    @property
+    def attributionEngine(self) :
+        return self._attribution
+    
     @property
     def pricing_dt(self) :
         return self._pricing_dt
@@ -170,26 +336,20 @@ class BasePortfolio:
     def pricing_dt(self, new_dt:date):
         self._pricing_dt = new_dt
         self._securities.pricing_dt = new_dt
-        self.totalUpdate()
+        self._graph.invalidate('positions')
+        self.refresh()
         
-    @staticmethod
-    def _add_column(table: pd.DataFrame, column: str, securities) -> pd.DataFrame:
-        
-        table['eq_aux'] = table.index.map(securities.equities[column])
-        table['fnds_aux'] = table.index.map(securities.funds[column])
-        table['bonds_aux'] = table.index.map(securities.bonds[column])
-        table['options_aux'] = table.index.map(securities.options[column])
+    def _intern(self, blotter:pd.DataFrame) -> pd.DataFrame :
+        """
+        Blotter with the sid of each security (-1 if unknown) and its
+        currency (categorical) taken from the security master
+        """
+        blotter = blotter.copy()
+        sids = self._securities.master.sid(blotter.index)
+        blotter['sid'] = sids.astype(np.int32)
+        blotter['currency'] = self._securities.master.take('currency', sids)
         
-
-        m1 = table['eq_aux'].notna()
-        m2 = table['fnds_aux'].notna()
-        m3 = table['bonds_aux'].notna()
-        m4 = table['options_aux'].notna()
-
-        table[column] = np.select([m1, m2, m3, m4], [table['eq_aux'], table['fnds_aux'], table['bonds_aux'], table['options_aux']], default=np.nan)
-        # table.drop(['eq_aux', 'fnds_aux', 'bonds_aux', 'options_aux'], axis=1, inplace=True)
-
-        return table
+        return blotter
 
 class Bonds:
     """
@@ -197,14 +357,16 @@ class Bonds:
     :methods :
         data : Displays a DataFrame table with all the info
         avg : Displays the average yield, spread and duration of the portfolio
-        
-    :To Implement :
-        Tables with dv01 per rating/sector/duration
-        scenario analyses (with different inputs)
-        cash flow projection (adapt from before)
+        risk : RiskCube with dv01, mv, duration and spread by rating, sector,
+            country, ranking and maturity bucket
+        cash_projection : coupons and maturities by day, month or quarter
+        scenarios : ScenarioEngine with curve and spread shocks, P&L by position
+        key_rates : dv01 to each pillar of the zero curve by position, account
+            or for the portfolio
     """
 
-    def __init__(self, bonds: pd.DataFrame, securities):
+    def __init__(self, bonds: pd.DataFrame, securities, book, accounts:pd.DataFrame=None,
+                 pricing_dt:date=None):
         """
         Calculate the initial data to be displayed
         :parameters:
@@ -217,10 +379,27 @@ class Bonds:
                 ccy_price : USD / Currency format of price
                 mtm : USD market to market value of the position
                 asset_class : string with asset class
+            securities : Securities, reference data of the bonds
+            book : BondBook with the bonds priced on the date of the positions
+            accounts : DataFrame (Optional) with the quantity per (id, account),
+                used to group the cash projection by account
+            pricing_dt : date (Optional), date of the positions (default the
+                pricing date of the book)
         """
         self._securities = securities
+        self._book = book
+        self._pricing_dt = book.pricing_dt if pricing_dt is None else pricing_dt
+        self._accounts = accounts
+        self._ladder = None
+        self._risk = None
+        self._scenarios = None
+        self._key_rates = None
         if bonds.shape[0] > 0 :
-            bonds[['name', 'maturity', 'cpn', 'yield', 'dur', 'spread', 'country', 'sector', 'rating', 'ranking', 'Bond']] = self._securities.bonds[['name', 'maturity', 'cpn', 'yield', 'dur', 'spread', 'country', 'sector', 'rating', 'ranking', 'Bond']]
+            bonds[['name', 'maturity', 'cpn', 'country', 'sector', 'rating', 'ranking']] = self._securities.bonds[['name', 'maturity', 'cpn', 'country', 'sector', 'rating', 'ranking']]
+            bonds['Bond'] = [self._book.bond(x) if x in self._book.ids else None for x in bonds.index]
+            bonds[['yield', 'ytw', 'dur', 'mod_dur', 'convexity', 'spread', 'stw']] = self._book.data[['yield', 'ytw', 'dur', 'mod_dur', 'convexity', 'spread', 'stw']]
+            # USD dv01 of the position (book dv01 is per 1000 of quantity)
+            bonds['dv01'] = bonds['quantity'] * self._book.data['dv01'] / 1000 / bonds['ccy_price']
             bonds['aux_yield'] = bonds['mtm'] * bonds['yield']
             bonds['aux_dur'] = bonds['mtm'] * bonds['dur']
         
@@ -228,30 +407,70 @@ class Bonds:
                 'yield': bonds['aux_yield'].sum() / bonds['mtm'].sum(),
                 'duration': bonds['aux_dur'].sum() / bonds['mtm'].sum()
             }
-            bonds = bonds[['name', 'maturity', 'cpn', 'quantity', 'mtm', 'price', 'yield', 'dur', 'spread', 'country', 'sector', 'rating', 'ranking', 'Bond']]
+            self._ccy_price = bonds['ccy_price']
+            bonds = bonds[['name', 'maturity', 'cpn', 'quantity', 'mtm', 'price', 'yield', 'ytw', 'dur', 'mod_dur', 'convexity', 'dv01', 'spread', 'stw', 'country', 'sector', 'rating', 'ranking', 'Bond']]
             self._data = bonds.sort_values('maturity')
             
         else :
             self._avg = {}
             self._data = {}
+            self._ccy_price = pd.Series(dtype=float)
 
-    def cash_projection(self, start_dt:date, end_dt:date) -> pd.DataFrame:
-
-        ints = self._data.apply(lambda x: x['Bond'].cshf.loc[start_dt:end_dt] * x['quantity'], axis=1)
-        ints = pd.concat([x['flow'] for x in ints]).groupby('dates').sum()
-        mats = self._data[(self._data['maturity'] > start_dt)
-                     & (self._data['maturity'] <= end_dt)].set_index(
-                       'maturity').loc[:, 'quantity'] * 100
-        mats.index.set_names('dates', inplace=True)
-        mats = mats.groupby('dates').sum()
-
-        total_flow = pd.DataFrame(ints)
-        total_flow['maturities'] = mats
-        total_flow.fillna(0, inplace=True)
-        total_flow.loc[:, 'flow'] = total_flow.loc[:, 'flow'] - total_flow.loc[:, 'maturities']
-        total_flow = total_flow.groupby('dates').sum()
-
-        return total_flow
+    def cash_projection(self, start_dt:date, end_dt:date, freq:str='D', by:list[str]=None) -> pd.DataFrame:
+        """
+        Coupons (flow) and principal (maturities) from start_dt to end_dt
+        by day, month ('M') or quarter ('Q'), optionally by currency / account
+        """
+        return self.ladder.ladder(start_dt, end_dt, freq, by)
+    
+    def key_rates(self, by:str=None) -> pd.DataFrame :
+        """
+        USD key rate dv01 to each pillar of the zero curve (columns in days)
+        by position, by 'account' or for the whole 'portfolio'
+        """
+        if self._key_rates is None :
+            ids = self._data.index if len(self._data) > 0 else pd.Index([], name='id')
+            # Per unit of quantity, as the dv01 column
+            self._key_rates = self._book.keyRates(self._book.ids.get_indexer(ids)).div(1000 * self._ccy_price.reindex(ids).values, axis=0)
+        
+        if by == 'account' :
+            accounts = self._accounts[self._accounts.index.get_level_values('id').isin(self._key_rates.index)]
+            key_rates = self._key_rates.reindex(accounts.index.get_level_values('id'))
+            key_rates.index = accounts.index
+            return key_rates.mul(accounts['quantity'], axis=0).groupby(level='account').sum()
+        
+        key_rates = self._key_rates.mul(self._data['quantity'], axis=0) if len(self._data) > 0 else self._key_rates
+        if by == 'portfolio' :
+            return key_rates.sum().to_frame('portfolio').T
+        return key_rates
+    
+    @property
+    def risk(self) -> RiskCube :
+        if self._risk is None :
+            positions = self._data if len(self._data) > 0 else pd.DataFrame(columns=['maturity', 'mtm', 'dv01', 'dur', 'yield', 'spread'] + ['rating', 'sector', 'country', 'ranking'])
+            self._risk = RiskCube(positions, self._pricing_dt)
+        return self._risk
+    
+    @property
+    def scenarios(self) -> ScenarioEngine :
+        if self._scenarios is None :
+            holdings = self._data.copy() if len(self._data) > 0 else pd.DataFrame(columns=['quantity', 'rating', 'sector', 'country', 'ranking'])
+            holdings['ccy_price'] = self._ccy_price
+            self._scenarios = ScenarioEngine(self._book, holdings)
+        return self._scenarios
+    
+    @property
+    def ladder(self) -> CashFlowLadder :
+        if self._ladder is None :
+            if self._accounts is not None :
+                holdings = self._accounts.reset_index()
+            elif len(self._data) > 0 :
+                holdings = pd.DataFrame({'id' : self._data.index, 'quantity' : self._data['quantity'].values})
+            else :
+                holdings = pd.DataFrame({'id' : [], 'quantity' : []})
+            holdings['currency'] = holdings['id'].map(self._securities.bonds['currency'])
+            self._ladder = CashFlowLadder(self._book, holdings)
+        return self._ladder
     
     @property
     def avg(self):
@@ -272,35 +491,35 @@ class Options :
         Net Theta
     """
     
-    def __init__(self, options:pd.DataFrame, securities) :
+    def __init__(self, options:pd.DataFrame, volatilities) :
         """
         :parameters:
             options : pd.DataFrame, Option,
                 List of Options
+            volatilities : callable,
+                Vol surface of the date of the options (tenor, moneyness) -> vol
         """
         
         self._spot = options['Option'][0].spot
         self._options = options
-        self._securities = securities
+        self._volatilities = volatilities
         self.expandDetails()
         
     def expandDetails(self):
-        self._options[['price', 'tenor', 'c_p', 'strike', 'delta', 'delta$', 'vol',
-                       'gamma_up', 'gamma_down', 'vega_up', 'vega_down', 'theta']
-                     ] = self._options.apply(lambda x: pd.Series(
-            [x['Option'].price,
-             x['Option']._t, x['Option']._c_p, x['Option']._K,
-             x['Option'].delta,
-             x['Option'].delta * x['Option'].spot * x['quantity'] * x['ccy_price'],
-             x['Option'].vol,
-             x['Option'].gamma_up * x['Option'].spot * x['quantity'] * x['ccy_price'],
-             x['Option'].gamma_down * x['Option'].spot * x['quantity'] * x['ccy_price'],
-             x['Option'].vega_up * x['quantity'],
-             x['Option'].vega_down * x['quantity'],
-             x['Option'].theta * x['quantity']],
-            index=['price', 'tenor', 'c_p', 'strike', 'delta', 'delta$', 'vol',
-                   'gamma_up', 'gamma_down', 'vega_up',
-                   'vega_down', 'theta']), axis =1)
+        book = OptionBook.fromOptions(self._options['Option'].tolist(), ids=self._options.index)
+        greeks = book.data
+        notional = greeks['spot'] * self._options['quantity'] * self._options['ccy_price']
+        
+        self._options[['tenor', 'c_p', 'strike', 'delta', 'vol']] = greeks[['tenor', 'c_p', 'strike', 'delta', 'vol']]
+        # Market price of the options (model price only where it was set from a vol)
+        self._options['price'] = [x.price for x in self._options['Option']]
+        self._options['delta$'] = greeks['delta'] * notional
+        self._options['gamma_up'] = greeks['gamma_up'] * notional
+        self._options['gamma_down'] = greeks['gamma_down'] * notional
+        self._options['vega_up'] = greeks['vega_up'] * self._options['quantity']
+        self._options['vega_down'] = greeks['vega_down'] * self._options['quantity']
+        self._options['theta'] = greeks['mod_theta'] * self._options['quantity']
+        self._book = book
             
         self._options['mtm'] = self._options['quantity'] * self._options['price']
         
@@ -308,24 +527,25 @@ class Options :
         self._totalDelta = self._options['delta$'].sum()
         self._totalTheta = self._options['theta'].sum()
         self._mtm = self._options['mtm'].sum()
-        self.calc_matrix()
+        self._gammaUpMatrix = None
+        self._gammaDownMatrix = None
     
     def updatePrices(self, prices:dict) :
         self._options['price'] = self._options.index.map(prices)
         for opt, p in zip(self._options['Option'], self._options['price']) :
             opt.price = p
     
-    def updateSpot(self, spot) :
-        r = 0.04
-        i = 0.02
-        pricing_dt = date(2022, 12, 19) # Careful with that, to be changed in the future
-        # vol_c = vol_curve(pricing_dt, r, i) 
-        for opt in self._options['Option'] :
-            opt.spot = spot
-            opt.vol = interpolate((opt._t, opt._K), vol_c)
-        
+    def updateSpot(self, spot:float) :
+        # Vols of the whole book are read from the surface in one batch query
+        options = self._options['Option'].tolist()
+        t = np.array([x._t for x in options])
+        K = np.array([x._K for x in options])
+        vol = self._volatilities(t, K / spot - 1)
+        book = OptionBook([x._c_p for x in options], spot, K,
+                          [x._r for x in options], t, vol, ids=self._options.index)
+        book.updateOptions(options)
+        self._spot = spot
         self.expandDetails()
-        
     
     def calc_matrix(self) :
         
@@ -341,10 +561,18 @@ class Options :
                                                         columns='tenor',
                                                         aggfunc='sum')
         
+    @property
+    def book(self) :
+        return self._book
+    
     @property
     def gammaUpMatrix(self) :
+        if self._gammaUpMatrix is None :
+            self.calc_matrix()
         return self._gammaUpMatrix
     
     @property
     def gammaDownMatrix(self) :
+        if self._gammaDownMatrix is None :
+            self.calc_matrix()
         return self._gammaDownMatrix
\ No newline at end of file
@@ -0,0 +1,77 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import numpy as np
+import pandas as pd
+from datetime import date
+
+LADDER_freq = {'D' : 'datetime64[D]', 'M' : 'datetime64[M]', 'Q' : 'datetime64[M]'}
+
+class CashFlowLadder :
+
+    def __init__(self, book, holdings:pd.DataFrame) :
+        """
+        Coupon and principal flows of every holding stacked once into flat
+        arrays, so any horizon, bucketing and grouping is one aggregation
+        :parameters:
+            book : BondBook,
+                Book with the schedules of the bonds
+            holdings : pd.DataFrame,
+                One row per holding with the columns id, quantity and any
+                column to group by (currency, account...)
+
+        :methods:
+            ladder : coupons and maturities between two dates by day, month
+                or quarter, optionally by holdings columns
+        """
+        holdings = holdings[book.ids.get_indexer(holdings['id']) >= 0].reset_index(drop=True)
+        dates, coupons, principal = book.flows()
+        pos = book.ids.get_indexer(holdings['id'])
+        rows, cols = np.nonzero(~np.isnat(dates[pos]))
+        quantity = holdings['quantity'].values.astype(float)[rows]
+
+        self._holdings = holdings
+        self._row = rows
+        self._dates = dates[pos][rows, cols]
+        self._coupons = coupons[pos][rows, cols] * quantity
+        self._principal = principal[pos][rows, cols] * quantity
+
+    def ladder(self, start_dt:date, end_dt:date, freq:str='D', by:list[str]=None) -> pd.DataFrame :
+        """
+        Coupons (flow) and principal (maturities) paid from start_dt to end_dt
+        :parameters:
+            freq : str,
+                Bucket of the dates : 'D' day, 'M' month or 'Q' quarter
+                (buckets are labelled by their first day)
+            by : list, str (Optional),
+                Holdings columns to group by (e.g. ['currency', 'account'])
+        """
+        sel = (self._dates >= np.datetime64(start_dt, 'D')) & (self._dates <= np.datetime64(end_dt, 'D'))
+        buckets = self._dates[sel].astype(LADDER_freq[freq])
+        if freq == 'Q' :
+            months = buckets.astype(int)
+            buckets = (months - months % 3).astype('datetime64[M]')
+        b_code, b_uniques = pd.factorize(buckets.astype('datetime64[D]'), sort=True)
+
+        by = [] if by is None else by
+        if by :
+            groups = pd.MultiIndex.from_frame(self._holdings[by].fillna(''))
+            g_code, g_uniques = groups.factorize()
+            g_code = g_code[self._row[sel]]
+        else :
+            g_code, g_uniques = np.zeros(b_code.shape[0], dtype=int), [None]
+
+        code = g_code * len(b_uniques) + b_code
+        size = len(g_uniques) * len(b_uniques)
+        flow = np.bincount(code, self._coupons[sel], minlength=size)
+        maturities = np.bincount(code, self._principal[sel], minlength=size)
+        used = np.bincount(code, minlength=size) > 0
+
+        dates = pd.Index([x.item() for x in b_uniques.astype('datetime64[D]')], name='dates')
+        if by :
+            index = pd.MultiIndex.from_tuples([(*g, d) for g in g_uniques for d in dates],
+                                              names=by + ['dates'])
+        else :
+            index = dates
+
+        return pd.DataFrame({'flow' : flow, 'maturities' : maturities}, index=index)[used]
@@ -0,0 +1,108 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import numpy as np
+import pandas as pd
+from datetime import date
+
+from .positions import PositionsIndex
+
+class NavEngine :
+
+    def __init__(self, securities, positions:PositionsIndex) :
+        """
+        NAV of a portfolio for a whole array of dates in one pass :
+        positions (dates x ids) x prices (dates x ids) / fx (dates x ids),
+        without moving the pricing date of the portfolio or the securities
+        :parameters:
+            securities : Securities,
+                Source of the price and fx histories
+            positions : PositionsIndex,
+                Positions and cash ledger of the portfolio
+
+        :methods:
+            breakdown : USD amount per asset class (and cash) for each date
+
+            unitValues : quantities and USD unit values per id for each date
+
+            flowValues : USD external cash flows between pairs of dates
+
+        The current pricing date of the securities is valued with their
+        current prices and rates, as the portfolio snapshots
+        """
+        self._securities = securities
+        self._positions = positions
+
+    def unitValues(self, dates:list[date]) -> tuple :
+        """
+        Ids, (dates x ids) quantities, (dates x ids) USD value of one unit
+        and the asset class of each id (codes into asset_classes)
+        """
+        ids, quantity = self._positions.quantityMatrix(dates)
+        master = self._securities.master
+        sids = master.sid(ids)
+        prices = self._securities.priceMatrix(dates, ids)
+
+        ccy_pos, currencies = pd.factorize(master.take('currency', sids))
+        fx = self._fxMatrix(dates, currencies)
+
+        # The current date of the securities keeps the inputs set on them
+        current = self._current(dates)
+        if current.any() :
+            price = master.take('price', sids)
+            prices[current] = np.where(np.isnan(price), prices[current], price)
+
+        ccy_price = np.where(ccy_pos >= 0, fx[:, np.maximum(ccy_pos, 0)], np.nan)
+        codes, asset_classes = pd.factorize(master.take('asset_class', sids))
+
+        return ids, quantity, prices / ccy_price, codes, asset_classes
+
+    def _current(self, dates:list[date]) -> np.ndarray :
+        return np.array(dates, dtype='datetime64[D]') == np.datetime64(self._securities.pricing_dt, 'D')
+
+    def _fxMatrix(self, dates:list[date], currencies) -> np.ndarray :
+        """
+        (dates x currencies) rates, the current ones on the current date
+        """
+        fx = self._securities.fxMatrix(dates, currencies)
+        current = self._current(dates)
+        if current.any() :
+            fx[current] = self._securities.fxEngine.rates(currencies)
+        return fx
+
+    def flowValues(self, starts:list[date], ends:list[date]) -> np.ndarray :
+        """
+        USD value of the external cash flows between each start (excluded)
+        and end, at the rates of the start
+        """
+        dates = list(starts) + list(ends)
+        ccys, flows = self._positions.flowMatrix(dates)
+        flows = flows[len(starts):] - flows[:len(starts)]
+        return np.nan_to_num(flows / self._fxMatrix(starts, ccys)).sum(axis=1)
+
+    @staticmethod
+    def byClass(values:np.ndarray, codes:np.ndarray, n:int) -> np.ndarray :
+        """
+        (dates x ids) amounts summed into (dates x n) asset classes
+        """
+        onehot = np.zeros((codes.shape[0], n))
+        onehot[codes >= 0, codes[codes >= 0]] = 1
+        return np.nan_to_num(values) @ onehot
+
+    def cashValues(self, dates:list[date]) -> np.ndarray :
+        """
+        USD value of the cash for each date
+        """
+        ccys, cash = self._positions.cashMatrix(dates)
+        return np.nan_to_num(cash / self._fxMatrix(dates, ccys)).sum(axis=1)
+
+    def breakdown(self, dates:list[date]) -> pd.DataFrame :
+        ids, quantity, unit, codes, asset_classes = self.unitValues(dates)
+        amounts = self.byClass(quantity * unit, codes, asset_classes.shape[0])
+
+        return pd.DataFrame(np.column_stack([amounts, self.cashValues(dates)]),
+                            index=pd.Index(dates),
+                            columns=list(asset_classes) + ['cash'])
+
+    def nav(self, dates:list[date]) -> pd.Series :
+        return self.breakdown(dates).sum(axis=1).rename('nav')
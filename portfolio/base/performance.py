@@ -10,57 +10,44 @@ from datetime import datetime as dt
 from datetime import date
 
 from .base import BasePortfolio
+from .snapshot import PortfolioSnapshot
 
 # from _bonds import cash_projection
 # from _equities import dvd_projection
 
 class Performance(BasePortfolio) :
     
-    def movements(self, start_dt:date, end_dt:date) -> pd.DataFrame:
-        
+    def movements(self, start_dt:date, end_dt:date, valuation:PortfolioSnapshot=None) -> pd.DataFrame:
+        """
+        Trades between start_dt and end_dt by asset class, valued with the
+        prices of valuation (default the current snapshot)
+        """
+        valuation = self.snapshot() if valuation is None else valuation
         blotter = self._blotter[(self._blotter['date'] > start_dt)
-                           & (self._blotter['date'] <= end_dt)]
-        blotter = self._add_column(blotter, 'price', self._securities)
-        
-        #To be fixed with better currency pricing and prices
-        blotter['ccy_price'] = blotter['currency'].map(self._securities.fx['price'])
+                           & (self._blotter['date'] <= end_dt)].copy()
+        sids = blotter.pop('sid').values
+        blotter['price'] = np.where(sids >= 0, valuation.prices.values[sids], np.nan)
+        blotter['ccy_price'] = self._securities.fxEngine.rates(blotter['currency'], [valuation.pricing_dt])[0]
         blotter['mtm'] = blotter['quantity'] * blotter['price'] / blotter['ccy_price']
 
-        blotter['asset_class'] = blotter.index.map(self._securities.funds['asset_class'])
-        A = blotter.index
-        B = self._securities.equities.index
-        c = np.where(pd.Index(pd.unique(B)).get_indexer(A) >= 0)[0]
-        blotter.loc[:, 'asset_class'].iloc[c] = 'equity'
-        
-        A = blotter.index
-        B = self._securities.bonds.index
-        c = np.where(pd.Index(pd.unique(B)).get_indexer(A) >= 0)[0]
-        blotter.loc[:, 'asset_class'].iloc[c] = 'bond'
-        
-        A = blotter.index
-        B = self._securities.options.index
-        c = np.where(pd.Index(pd.unique(B)).get_indexer(A) >= 0)[0]
-        blotter.loc[:, 'asset_class'].iloc[c] = 'option'
+        # Grouped as the snapshots breakdowns
+        blotter['asset_class'] = np.asarray(self._securities.master.take('asset_class', sids))
 
         return blotter.groupby('asset_class').sum(numeric_only=True)
     
-    def cashMovements(self, start_dt:date, end_dt:date) -> pd.DataFrame:
+    def cashMovements(self, start_dt:date, end_dt:date, valuation:PortfolioSnapshot=None) -> pd.DataFrame:
+        valuation = self.snapshot() if valuation is None else valuation
         cash_blotter = (self._cash_blotter.loc[(self._cash_blotter['date'] > start_dt)
                                              & (self._cash_blotter['date'] <= end_dt)]
                         .groupby('currency').sum(numeric_only=True))
-        cash_blotter['ccy_price'] = cash_blotter.index.map(self._securities.fx['price'])
+        cash_blotter['ccy_price'] = self._securities.fxEngine.rates(cash_blotter.index, [valuation.pricing_dt])[0]
         cash_blotter['mtm'] = cash_blotter['amount'] / cash_blotter['ccy_price']
         
         return cash_blotter
         
         
     def historicalPerformance(self, dates:list[date]) -> pd.Series:
-        nav = {}
-        for certain_date in dates :
-            self.pricing_dt = certain_date
-            nav[certain_date] = self._assets['amount']
-    
-        history = pd.DataFrame.from_dict(nav, orient = 'index')
+        history = self._navEngine.breakdown(dates)
         history['nav'] = history.sum(axis = 1)
         history['perf'] = round( history['nav'] / history['nav'].shift(1) - 1 , 4)
         history['cumPerf'] = round( history['nav'] / history['nav'].iloc[0] -1, 4)
@@ -81,18 +68,14 @@ class Performance(BasePortfolio) :
         plt.xticks(fontsize=12)
         plt.yticks(fontsize=12)
         
-        self.basePort()
-        
         return history.loc[:, 'perf']
     
     def performanceAttribution(self, start_dt:date, end_dt:date) :
-        self.pricing_dt = start_dt
-        values = self._assets
+        end = self.snapshot(end_dt)
+        values = self.snapshot(start_dt).assets
+        values['endAmt'] = end.assets['amount']
 
-        self.pricing_dt = end_dt
-        values['endAmt'] = self._assets['amount']
-
-        mvmts = self.movements(start_dt, end_dt).groupby('asset_class').sum()['mtm']
+        mvmts = self.movements(start_dt, end_dt, end).groupby('asset_class').sum()['mtm']
 
         values['adjEndAmt'] = pd.Series({x: values.loc[x, 'endAmt']-mvmts[x] if (x in mvmts.index) else values.loc[x, 'endAmt'] for x in values.index})
         values.loc['cash', 'adjEndAmt'] = values.loc['cash', 'endAmt'] + mvmts.sum()
@@ -102,35 +85,17 @@ class Performance(BasePortfolio) :
         values = self.transformValues(values)
         self.printValues(values, start_dt, end_dt)
         
-        self.basePort()
-        
     def performanceAttribution2(self, start_dt:date, end_dt:date) :
-        self.pricing_dt = end_dt
-        table = self._assets
-
-        self.pricing_dt = start_dt
-        table['start_amt'] = self._assets['amount']
-        
-        try :
-            table['mvmts'] = self.movements(start_dt, end_dt)['mtm']
-        except :
-            table['mvmts'] = [0] * table.shape[0]
-        
-        try :
-            cash_mvmts = self.cashMovements(start_dt, end_dt)['mtm'].sum()
-        except : 
-            cash_mvmts = 0
-        table.loc['cash', 'mvmts'] = - table['mvmts'].sum() + cash_mvmts
-        
-        table.fillna(0, inplace=True)
-        table['pnl'] = table['amount'] - table['mvmts'] - table['start_amt']
-        table['perf'] = table['pnl'] / table['start_amt']
-        table['perfAttr'] = table['perf'] * table['%']
-        table.replace([np.inf, -np.inf], 0, inplace=True)
-        
-        self.basePort()
-        
-        return table
+        return self.attribution({'window' : (start_dt, end_dt)}).loc['window']
+    
+    def attribution(self, windows:dict=None) -> pd.DataFrame :
+        """
+        Attribution per asset class of a batch of windows (name : (start_dt,
+        end_dt), default D-1, MTD, QTD and YTD of the pricing date), all
+        valued at once without moving the pricing date
+        """
+        windows = self._attribution.standardWindows(self._pricing_dt) if windows is None else windows
+        return self._attribution.attribution(windows)
 
     def transformValues(self, values) : 
         values['absPerfAttr'] = abs(values['perfAttr'])
@@ -231,12 +196,10 @@ class Performance(BasePortfolio) :
         plt.yticks(fontsize=12)
     
     def cashFlowProjection(self, start_dt, end_dt) :
-        all_cash = self._bonds.cash_projection(start_dt, end_dt)
+        all_cash = self._snapshot.bonds.cash_projection(start_dt, end_dt, freq='M')
         # dvds = dvd_projection(shared.port.equities, initial_date, end_date)
         # all_cash = pd.concat([interests, dvds])
-        all_cash['month'] = [k.strftime('%y-%m') for k in all_cash.index]
-        all_cash = all_cash.groupby('month').sum()
-        all_cash.index = [dt.strptime(k, '%y-%m').strftime('%b-%y') for k in all_cash.index]
+        all_cash.index = [k.strftime('%b-%y') for k in all_cash.index]
         
         f, ax = plt.subplots(figsize = (12,8))
         f.suptitle(f'Cash Flow expected\nFrom {start_dt} to {end_dt}', fontsize = 16, fontweight = 'bold')
@@ -0,0 +1,189 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import numpy as np
+import pandas as pd
+from datetime import date
+
+_DAY_OFFSET = 2 ** 31 # keeps (key, day) composite keys positive
+
+class CumulativeLedger :
+
+    def __init__(self, keys:np.ndarray, dates:np.ndarray, values:np.ndarray) :
+        """
+        Entries sorted by (key, date) with cumulative sums of the values
+        per key (CSR layout). The as-of value of every key for a date is a
+        single binary search over the composite (key, date)
+        :parameters:
+            keys : np.ndarray or pd.Index,
+                Key of each entry (security id, currency, (id, account)...)
+            dates : np.ndarray,
+                Date of each entry
+            values : np.ndarray,
+                (entries x values) amounts to accumulate
+        """
+        keys = keys if isinstance(keys, pd.Index) else pd.Index(np.asarray(keys, dtype=object))
+        code, self._keys = keys.factorize()
+        self._keys = self._keys.set_names(keys.names)
+        days = np.array(dates, dtype='datetime64[D]').astype(np.int64)
+        values = np.asarray(values, dtype=float)
+        values = values[:, None] if values.ndim == 1 else values
+
+        order = np.lexsort((days, code))
+        self._code = code[order]
+        self._days = days[order]
+        self._composite = self._compose(self._code, self._days)
+        self._ptr = np.searchsorted(self._code, np.arange(len(self._keys) + 1))
+
+        cum = np.cumsum(values[order], axis=0)
+        base = np.vstack([np.zeros((1, values.shape[1])), cum])[self._ptr[:-1]]
+        self._cum = cum - np.repeat(base, np.diff(self._ptr), axis=0)
+
+    @staticmethod
+    def _compose(code:np.ndarray, days:np.ndarray) -> np.ndarray :
+        return (np.asarray(code, dtype=np.int64) << 32) + (days + _DAY_OFFSET)
+
+    def asof(self, pricing_dt:date) -> tuple :
+        """
+        Keys with entries on or before pricing_dt and their cumulative values
+        """
+        day = np.datetime64(pricing_dt, 'D').astype(np.int64)
+        codes = np.arange(len(self._keys))
+        idx = np.searchsorted(self._composite, self._compose(codes, day), side='right')
+        has = idx > self._ptr[:-1]
+
+        return self._keys[has], self._cum[idx[has] - 1]
+
+    def asofMatrix(self, dates:list[date]) -> np.ndarray :
+        """
+        (dates x keys x values) cumulative values for an array of dates,
+        zero for keys without entries yet
+        """
+        days = np.array(dates, dtype='datetime64[D]').astype(np.int64)
+        codes = np.arange(len(self._keys))
+        idx = np.searchsorted(self._composite, self._compose(codes[None, :], days[:, None]), side='right')
+        has = idx > self._ptr[None, :-1]
+
+        return np.where(has[:, :, None], self._cum[np.maximum(idx - 1, 0)], 0.)
+
+    def append(self, key, entry_dt:date, values:np.ndarray) :
+        """
+        Inserts one entry, updating the cumulative sums of its key only
+        """
+        values = np.asarray(values, dtype=float).reshape(1, -1)
+        if key not in self._keys :
+            self._keys = self._keys.insert(len(self._keys), key)
+            self._ptr = np.append(self._ptr, self._ptr[-1])
+        code = self._keys.get_loc(key)
+        day = np.datetime64(entry_dt, 'D').astype(np.int64)
+        composite = self._compose(code, day)
+
+        pos = np.searchsorted(self._composite, composite, side='right')
+        prev = self._cum[pos - 1] if pos > self._ptr[code] else np.zeros(values.shape[1])
+        end = self._ptr[code + 1]
+        self._cum[pos:end] += values
+
+        self._code = np.insert(self._code, pos, code)
+        self._days = np.insert(self._days, pos, day)
+        self._composite = np.insert(self._composite, pos, composite)
+        self._cum = np.insert(self._cum, pos, prev + values, axis=0)
+        self._ptr[code + 1:] += 1
+
+    @property
+    def keys(self) :
+        return self._keys
+
+class PositionsIndex :
+
+    def __init__(self, blotter:pd.DataFrame, cash_blotter:pd.DataFrame) :
+        """
+        Positions, cost and cash ledger of a portfolio for any date,
+        built once from the blotters
+        :parameters:
+            blotter : pd.DataFrame,
+                Trades indexed by id with date, quantity, cost_price and currency
+            cash_blotter : pd.DataFrame,
+                Cash movements indexed by currency with date and amount
+
+        :methods:
+            positions : quantity and avg cost_price per id as of a date
+
+            accounts : quantity per (id, account) as of a date
+
+            cash : amount per currency as of a date
+
+            quantityMatrix / cashMatrix : the same for a whole array of dates
+
+            flowMatrix : cumulative external cash flows for an array of dates
+
+            addTrade / addCash : appends a movement to the index
+        """
+        quantity = blotter['quantity'].values.astype(float)
+        cost = quantity * blotter['cost_price'].values.astype(float)
+        self._trades = CumulativeLedger(blotter.index.values, blotter['date'].values,
+                                        np.column_stack([quantity, cost]))
+
+        # Same trades by (id, account)
+        accounts = blotter['account'].fillna('').values if 'account' in blotter.columns else np.full(quantity.shape[0], '')
+        self._accounts = CumulativeLedger(pd.MultiIndex.from_arrays([blotter.index.values, accounts],
+                                                                    names=['id', 'account']),
+                                          blotter['date'].values, quantity)
+
+        # Cash ledger : cash movements plus the cash leg of every trade
+        traded = blotter['currency'].notna().values
+        self._cash = CumulativeLedger(np.concatenate([cash_blotter.index.values, np.asarray(blotter['currency'])[traded]]),
+                                      np.concatenate([cash_blotter['date'].values, blotter['date'].values[traded]]),
+                                      np.concatenate([cash_blotter['amount'].values.astype(float), -cost[traded]]))
+
+        # External flows : cash movements only (subscriptions, redemptions, fees...)
+        self._flows = CumulativeLedger(cash_blotter.index.values, cash_blotter['date'].values,
+                                       cash_blotter['amount'].values.astype(float))
+
+    def positions(self, pricing_dt:date) -> pd.DataFrame :
+        ids, cum = self._trades.asof(pricing_dt)
+        with np.errstate(invalid='ignore', divide='ignore') :
+            cost_price = cum[:, 1] / cum[:, 0]
+
+        return pd.DataFrame({'quantity' : cum[:, 0], 'cost_price' : cost_price},
+                            index=pd.Index(ids, name='id'))
+
+    def accounts(self, pricing_dt:date) -> pd.DataFrame :
+        keys, cum = self._accounts.asof(pricing_dt)
+
+        return pd.DataFrame({'quantity' : cum[:, 0]}, index=keys)
+
+    def cash(self, pricing_dt:date) -> pd.DataFrame :
+        ccys, cum = self._cash.asof(pricing_dt)
+
+        return pd.DataFrame({'amount' : cum[:, 0]},
+                            index=pd.Index(ccys, name='currency'))
+
+    def quantityMatrix(self, dates:list[date]) -> tuple :
+        """
+        Ids and (dates x ids) quantities held on each date
+        """
+        return self._trades.keys, self._trades.asofMatrix(dates)[:, :, 0]
+
+    def cashMatrix(self, dates:list[date]) -> tuple :
+        """
+        Currencies and (dates x currencies) cash amounts on each date
+        """
+        return self._cash.keys, self._cash.asofMatrix(dates)[:, :, 0]
+
+    def flowMatrix(self, dates:list[date]) -> tuple :
+        """
+        Currencies and (dates x currencies) cumulative external cash flows
+        (cash movements without the cash legs of the trades)
+        """
+        return self._flows.keys, self._flows.asofMatrix(dates)[:, :, 0]
+
+    def addTrade(self, _id:str, trade_dt:date, quantity:float, cost_price:float, currency:str,
+                 account:str=None) :
+        self._trades.append(_id, trade_dt, [quantity, quantity * cost_price])
+        self._accounts.append((_id, '' if account is None else account), trade_dt, [quantity])
+        if isinstance(currency, str) :
+            self._cash.append(currency, trade_dt, [-quantity * cost_price])
+
+    def addCash(self, currency:str, cash_dt:date, amount:float) :
+        self._cash.append(currency, cash_dt, [amount])
+        self._flows.append(currency, cash_dt, [amount])
@@ -16,18 +16,19 @@ class Reports(BasePortfolio) :
     
     def OptionsReport(self, period:str='mtd') :
         
+        base = self.snapshot(self._basePricing_dt)
+        _assets = base.assets
+        _options = base.options
         if period == 'mtd' :
             mtd_date = (date(self._basePricing_dt.year, self._basePricing_dt.month, 1) - CDay(1)).date()
-            self.pricing_dt = mtd_date
             try :
-                _totalMtm_Mtd = self._assets['amount'].sum()
+                _totalMtm_Mtd = self.snapshot(mtd_date).assets['amount'].sum()
             except :
                 print('No assets')
                 _totalMtm_Mtd = 0
             
-            self.basePort()
             try :
-                _cashMvmts = self.cashMovements(mtd_date, self._basePricing_dt)['amount'].sum()
+                _cashMvmts = self.cashMovements(mtd_date, self._basePricing_dt, base)['amount'].sum()
             except : 
                 print('No Cash Mvmt')
                 _cashMvmts = 0
@@ -35,20 +36,20 @@ class Reports(BasePortfolio) :
         
         _date = format(dt.now(), '%Y-%b-%d %H:%M')
         _portDelta = 0
-        if 'equity' in self._assets.index :
-            _portDelta += self._assets.loc['equity', 'amount']
-        if 'equities' in self._assets.index :
-            _portDelta += self._assets.loc['equities', 'amount']
-        if 'multi-asset' in self._assets.index :
-            _portDelta += self._assets.loc['multi-asset', 'amount'] / 2
+        if 'equity' in _assets.index :
+            _portDelta += _assets.loc['equity', 'amount']
+        if 'equities' in _assets.index :
+            _portDelta += _assets.loc['equities', 'amount']
+        if 'multi-asset' in _assets.index :
+            _portDelta += _assets.loc['multi-asset', 'amount'] / 2
             
-        _totalDelta = _portDelta + self._options._totalDelta
-        _totalMtm = self._assets['amount'].sum()
+        _totalDelta = _portDelta + _options._totalDelta
+        _totalMtm = _assets['amount'].sum()
         _totalDeltaPer = _totalDelta / _totalMtm 
         _pnl = _totalMtm - _cashMvmts - _totalMtm_Mtd 
-        _gammaUpMatrix = self._options.gammaUpMatrix.copy()
+        _gammaUpMatrix = _options.gammaUpMatrix.copy()
         _gammaUpMatrix.columns = np.round(_gammaUpMatrix.columns, 2).astype(str)
-        _gammaDownMatrix = self._options.gammaDownMatrix.copy()
+        _gammaDownMatrix = _options.gammaDownMatrix.copy()
         _gammaDownMatrix.columns = np.round(_gammaDownMatrix.columns, 2).astype(str)
         
         tpl = ""
@@ -59,13 +60,13 @@ class Reports(BasePortfolio) :
         tpl = tpl.replace('{{date}}', _date)
         tpl = tpl.replace('{{period}}', period)
         
-        tpl = tpl.replace('{{optionsDelta}}', "{:,.0f}".format(self._options._totalDelta))
+        tpl = tpl.replace('{{optionsDelta}}', "{:,.0f}".format(_options._totalDelta))
         tpl = tpl.replace('{{portDelta}}', "{:,.0f}".format(_portDelta))
         tpl = tpl.replace('{{totalDelta$}}', "{:,.0f}".format(_totalDelta))
         tpl = tpl.replace('{{totalDelta%}}', "{:.2%}".format(_totalDeltaPer))
         
-        tpl = tpl.replace('{{gamma}}', "{:,.0f}".format(self._options._totalGamma))
-        tpl = tpl.replace('{{theta}}', "{:,.0f}".format(self._options._totalTheta))
+        tpl = tpl.replace('{{gamma}}', "{:,.0f}".format(_options._totalGamma))
+        tpl = tpl.replace('{{theta}}', "{:,.0f}".format(_options._totalTheta))
                 
         tpl = tpl.replace('{{mtm}}', "{:,.0f}".format(_totalMtm))
         tpl = tpl.replace('{{mtm_mtd}}', "{:,.0f}".format(_totalMtm_Mtd))
@@ -89,18 +90,18 @@ class Reports(BasePortfolio) :
          
         total_mtm = '{:,.0f}'.format(self._assets['amount'].sum())    
         
+        windows = self._attribution.standardWindows(_base_pricing_dt)
+        attribution = self.attribution({k : windows[k] for k in ['D-1', 'MTD']})
+        
         #YESTERDAY FIGURES
-        d1_date = (_base_pricing_dt - CDay(1)).date()
-        table = self.performanceAttribution2(d1_date, _base_pricing_dt)
-        table.rename(columns = {'start_amt' : 'd1_start_amt',
-                                'mvmts' : 'd1_mvmts',
-                                'pnl' : 'd1_pnl',
-                                'perf' : 'd1_perf',
-                                'perfAttr' : 'd1_perfAttr'}, inplace=True)
+        table = attribution.loc['D-1'].rename(columns = {'start_amt' : 'd1_start_amt',
+                                                         'mvmts' : 'd1_mvmts',
+                                                         'pnl' : 'd1_pnl',
+                                                         'perf' : 'd1_perf',
+                                                         'perfAttr' : 'd1_perfAttr'})
         
         #MTD FIGURES
-        mtd_date = (date(_base_pricing_dt.year, _base_pricing_dt.month, 1) - CDay(1)).date()
-        mtd_table = self.performanceAttribution2(mtd_date, _base_pricing_dt)
+        mtd_table = attribution.loc['MTD']
         table[['mtd_start_amt', 'mtd_mvmts', 'mtd_pnl', 'mtd_perf', 'mtd_perfAttr']] = mtd_table[['start_amt', 'mvmts', 'pnl', 'perf', 'perfAttr']]
             
         _date = format(dt.now(), '%Y-%b-%d %H:%M')
@@ -110,8 +111,6 @@ class Reports(BasePortfolio) :
         mtd_pnl = table['mtd_pnl'].sum()
         mtd_pnl_p = table['mtd_perfAttr'].sum()
         
-        self.basePort()
-        
         tpl = ""
         with open(FOLDER + 'reports/pnlReport.html') as f:
             tpl = f.read()
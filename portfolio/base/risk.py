@@ -0,0 +1,60 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import numpy as np
+import pandas as pd
+from datetime import date
+
+RISK_dims = ['rating', 'sector', 'country', 'ranking', 'maturity_bucket']
+MATURITY_buckets = [0, 1, 3, 5, 7, 10, 20, np.inf] # years
+MATURITY_labels = ['0-1y', '1-3y', '3-5y', '5-7y', '7-10y', '10-20y', '20y+']
+
+class RiskCube :
+
+    def __init__(self, positions:pd.DataFrame, pricing_dt:date) :
+        """
+        Bond risk aggregated once over every combination of rating, sector,
+        country, ranking and maturity bucket. Any table of one or two
+        dimensions is then read from the (small) cube
+        :parameters:
+            positions : pd.DataFrame,
+                Bond positions with maturity, rating, sector, country,
+                ranking, mtm, dv01 (USD), dur, yield and spread
+            pricing_dt : date,
+                Pricing Date (for the maturity buckets)
+
+        :methods:
+            table : dv01, mv (sums) or dur, yield, spread (mv weighted)
+                by one or two dimensions
+        """
+        years = (np.array(positions['maturity'].tolist(), dtype='datetime64[D]')
+                 - np.datetime64(pricing_dt, 'D')).astype(int) / 365
+        dims = {dim : pd.Categorical(positions[dim].fillna('-')) for dim in RISK_dims[:-1]}
+        dims['maturity_bucket'] = pd.cut(years, MATURITY_buckets, labels=MATURITY_labels, right=False)
+
+        mv = positions['mtm'].values
+        values = pd.DataFrame({'dv01' : positions['dv01'].values,
+                               'mv' : mv,
+                               'dur' : mv * positions['dur'].values,
+                               'yield' : mv * positions['yield'].values,
+                               'spread' : mv * positions['spread'].values})
+        values = pd.concat([pd.DataFrame(dims), values], axis=1)
+        self._cube = values.groupby(RISK_dims, observed=True).sum()
+
+    def table(self, rows:str, cols:str=None, value:str='dv01') -> pd.DataFrame :
+        """
+        Risk by rows (and cols) dimensions, value in dv01, mv, dur, yield, spread
+        """
+        by = [rows] if cols is None else [rows, cols]
+        grouped = self._cube.groupby(level=by, observed=True).sum()
+        if value in ['dur', 'yield', 'spread'] :
+            with np.errstate(invalid='ignore', divide='ignore') :
+                result = grouped[value] / grouped['mv']
+        else :
+            result = grouped[value]
+
+        return result.to_frame(value) if cols is None else result.unstack(cols)
+
+    @property
+    def cube(self) :
+        return self._cube.copy()
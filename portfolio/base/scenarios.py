@@ -0,0 +1,134 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import numpy as np
+import pandas as pd
+
+TWIST_pivot = 5 * 365 # days, unchanged tenor of a twist
+BUTTERFLY_belly = 5 * 365 # days, centre of a butterfly
+
+class ScenarioEngine :
+
+    def __init__(self, book, holdings:pd.DataFrame) :
+        """
+        Yield curve and spread scenarios on bond positions. Shocks are
+        collected per scenario and every position is fully revalued under
+        every scenario in one BondBook.revalue call
+        :parameters:
+            book : BondBook,
+                Book with the bonds (and the curve) to revalue
+            holdings : pd.DataFrame,
+                Positions indexed by id with quantity, ccy_price and any
+                column to select spread shocks (rating, sector...)
+
+        :methods:
+            parallel, twist, butterfly, keyRate : shocks of the zero rates
+                of the curve pillars (in bp)
+
+            spread : shock of the spreads of a selection of positions (in bp)
+
+            pnl : (scenarios x positions) USD P&L
+
+        Shocks added to an existing scenario are summed, e.g.
+            engine.parallel('bear', 50).spread('bear', 100, rating=['BB', 'B'])
+        """
+        holdings = holdings[book.ids.get_indexer(holdings.index) >= 0]
+        self._book = book
+        self._holdings = holdings
+        self._rows = book.ids.get_indexer(holdings.index)
+        self._pillars = book.curve.days
+        self._curve_shift = {}
+        self._spread_shift = {}
+
+    def _scenario(self, name:str) :
+        if name not in self._curve_shift :
+            self._curve_shift[name] = np.zeros(self._pillars.shape[0])
+            self._spread_shift[name] = np.zeros(self._rows.shape[0])
+
+    def _shiftCurve(self, name:str, shift:np.ndarray) :
+        self._scenario(name)
+        self._curve_shift[name] = self._curve_shift[name] + shift
+        return self
+
+    def parallel(self, name:str, bp:float) :
+        return self._shiftCurve(name, np.full(self._pillars.shape[0], float(bp)))
+
+    def twist(self, name:str, bp:float, pivot:int=TWIST_pivot) :
+        """
+        Steepener of bp between the first and the last pillar (flattener
+        with bp < 0), linear in days and unchanged at pivot (in days)
+        """
+        span = self._pillars[-1] - self._pillars[0]
+        return self._shiftCurve(name, bp * (self._pillars - pivot) / span)
+
+    def butterfly(self, name:str, bp:float, belly:int=BUTTERFLY_belly) :
+        """
+        Wings up and belly down by bp (the opposite with bp < 0), linear
+        in days from the belly (-bp) to the first and last pillars (+bp)
+        """
+        wing = np.where(self._pillars < belly, belly - self._pillars[0], self._pillars[-1] - belly)
+        return self._shiftCurve(name, bp * (2 * np.abs(self._pillars - belly) / wing - 1))
+
+    def keyRate(self, name:str, tenor:int, bp:float) :
+        """
+        Shock of a single pillar (tenor in days, as the index of Curves.zero)
+        """
+        pos = np.flatnonzero(self._pillars == tenor)
+        if pos.shape[0] == 0 :
+            raise KeyError(f'No pillar of {tenor} days in the curve')
+        shift = np.zeros(self._pillars.shape[0])
+        shift[pos] = bp
+        return self._shiftCurve(name, shift)
+
+    def spread(self, name:str, bp:float, **select) :
+        """
+        Spread shock of the positions matching every holdings column given,
+        e.g. spread('hy', 100, rating=['BB', 'B']) or spread('banks', 25, sector='Financial')
+        (all the positions without selection)
+        """
+        self._scenario(name)
+        match = np.ones(self._rows.shape[0], dtype=bool)
+        for column, values in select.items() :
+            values = values if isinstance(values, (list, tuple, set)) else [values]
+            match &= self._holdings[column].isin(values).values
+        self._spread_shift[name] = self._spread_shift[name] + np.where(match, float(bp), 0.)
+        return self
+
+    def clear(self) :
+        self._curve_shift = {}
+        self._spread_shift = {}
+
+    def pnl(self) -> pd.DataFrame :
+        """
+        (scenarios x positions) USD P&L of the full revaluation
+        """
+        names = list(self._curve_shift)
+        if len(names) == 0 or self._rows.shape[0] == 0 :
+            return pd.DataFrame(index=pd.Index(names, name='scenario'), columns=self._holdings.index, dtype=float)
+
+        prices = self._book.revalue(np.array([self._curve_shift[x] for x in names]),
+                                    np.array([self._spread_shift[x] for x in names]),
+                                    self._rows)
+        base = self._book.revalue(np.zeros((1, self._pillars.shape[0])), rows=self._rows)
+        weight = self._holdings['quantity'].values / self._holdings['ccy_price'].values
+
+        return pd.DataFrame((prices - base) * weight, index=pd.Index(names, name='scenario'),
+                            columns=self._holdings.index)
+
+    @property
+    def shocks(self) -> pd.DataFrame :
+        """
+        (scenarios x pillars) curve shocks in bp
+        """
+        return pd.DataFrame([self._curve_shift[x] for x in self._curve_shift],
+                            index=pd.Index(list(self._curve_shift), name='scenario'),
+                            columns=pd.Index(self._pillars.astype(int), name='days'))
+
+    @property
+    def spreads(self) -> pd.DataFrame :
+        """
+        (scenarios x positions) spread shocks in bp
+        """
+        return pd.DataFrame([self._spread_shift[x] for x in self._spread_shift],
+                            index=pd.Index(list(self._spread_shift), name='scenario'),
+                            columns=self._holdings.index)
@@ -0,0 +1,95 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import pandas as pd
+from datetime import date
+
+class PortfolioSnapshot :
+
+    __slots__ = ('_pricing_dt', '_port', '_cash', '_currencies', '_assets',
+                 '_prices', '_fx', '_market', '_builder', '_subportfolios')
+
+    def __init__(self, pricing_dt:date, port:pd.DataFrame, cash:pd.DataFrame,
+                 currencies:pd.DataFrame, assets:pd.DataFrame, prices:pd.Series,
+                 fx:pd.Series, market:dict, builder) :
+        """
+        Read only valuation of a portfolio on one date, with the market
+        state of its securities frozen when it is taken. Tables are handed
+        out as copies so reports can work on them without touching the
+        cached values
+        :parameters:
+            pricing_dt : date,
+                Valuation date
+            port, cash, currencies, assets : pd.DataFrame,
+                Positions, cash and breakdowns as in BasePortfolio
+            prices, fx : pd.Series,
+                Prices of every security and USD / Currency prices on the date
+            market : dict,
+                Market state of the held securities frozen on the date
+                (bond book, options, vol surface) for the subportfolios
+            builder : callable,
+                builder(snapshot, name) of the 'bonds', 'equities' and
+                'options' subportfolios, called on first access only
+        """
+        self._pricing_dt = pricing_dt
+        self._port = port
+        self._cash = cash
+        self._currencies = currencies
+        self._assets = assets
+        self._prices = prices
+        self._fx = fx
+        self._market = market
+        self._builder = builder
+        self._subportfolios = {}
+
+    def _subportfolio(self, name:str) :
+        if name not in self._subportfolios :
+            self._subportfolios[name] = self._builder(self, name)
+        return self._subportfolios[name]
+
+    @property
+    def pricing_dt(self) :
+        return self._pricing_dt
+
+    @property
+    def port(self) :
+        return self._port.copy()
+
+    @property
+    def cash(self) :
+        return self._cash.copy()
+
+    @property
+    def currencies(self) :
+        return self._currencies.copy()
+
+    @property
+    def assets(self) :
+        return self._assets.copy()
+
+    @property
+    def prices(self) :
+        return self._prices.copy()
+
+    @property
+    def fx(self) :
+        return self._fx.copy()
+
+    @property
+    def market(self) :
+        return self._market
+
+    @property
+    def bonds(self) :
+        return self._subportfolio('bonds')
+
+    @property
+    def equities(self) :
+        return self._subportfolio('equities').copy()
+
+    @property
+    def options(self) :
+        """
+        Options subportfolio (None without options)
+        """
+        return self._subportfolio('options')
@@ -0,0 +1,536 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import pandas as pd
+import numpy as np
+from datetime import datetime as dt
+from datetime import date
+
+from .utils.schedule import get_schedule, stack
+from .utils.curves import CurveInterpolator
+
+YIELD_e = 1e-8 # diff in price
+YIELD_max_it = 50
+SPREAD_e = 1e-8 # diff in price
+SPREAD_max_it = 50
+DV01_bump = 0.0001
+KEYRATE_chunk = 500 # bonds revalued together in keyRates
+BOOK_state = ['_cl_price', '_pv', '_y', '_spread', '_ytw', '_stw',
+              '_duration', '_mod_duration', '_convexity', '_dv01']
+BOOK_arrays = ['_maturity', '_coupon', '_call_dt', '_all_dates', '_all_flow', '_mask',
+               '_dates', '_days', '_flow', '_last_acc', '_acc'] + BOOK_state # one row per bond
+
+class BondBook :
+
+    def __init__(self, maturity:list[date], coupon:list[float], cl_price:list[float],
+                 us_zero:pd.DataFrame, pricing_dt:date=dt.now().date(),
+                 freq:int=6, ids:list=None, call_dt:list[date]=None) :
+        """
+        Columnar engine that calculates factors for a whole universe of Bonds
+        at once. Cash flows are kept in padded arrays (bonds x flows) and every
+        solver runs a masked Newton iteration over all the bonds together
+        :parameters:
+            maturity : list, date,
+                Maturities
+
+            coupon : list, float,
+                Coupons
+
+            cl_price : list, float,
+                Clean Prices
+
+            us_zero : pd.DataFrame or CurveInterpolator,
+                Us Curve to be used to calculate the Spreads
+
+            pricing_dt : date,
+                Pricing Date
+
+            freq : int,
+                Frequency (in months)
+
+            ids : list (Optional),
+                Ids of the bonds, used as index of data
+
+            call_dt : list, date (Optional),
+                First call date of the callable bonds (None otherwise),
+                callable at par on every coupon date from then on
+
+        :methods:
+            data : pd.DataFrame with price, yield, spread, yield and spread
+                to worst, durations, convexity and dv01 per bond
+
+            bond : Bond view over one position of the book
+
+            multiUpdate : reprice the whole book for a new date, prices and curve
+
+            reprice : reprice some bonds only (state / restore keep and reuse
+                the solved factors)
+
+            copy : independent book with all or some of the bonds
+
+            revalue : dirty prices under shifts of the curve and spreads
+
+            keyRates : dv01 to each pillar of the curve per bond
+        """
+        self._maturity = np.array(maturity, dtype='datetime64[D]')
+        self._coupon = np.asarray(coupon, dtype=float)
+        self._cl_price = np.asarray(cl_price, dtype=float).copy()
+        self._freq = freq
+        self._n = 12 / freq
+        self._ids = pd.Index(range(len(self._coupon)) if ids is None else ids)
+        self._call_dt = (np.full(self._coupon.shape[0], np.datetime64('NaT'), dtype='datetime64[D]') if call_dt is None
+                         else pd.to_datetime(pd.Series(list(call_dt), dtype=object), errors='coerce').values.astype('datetime64[D]'))
+        self._pricing_dt = pricing_dt
+        self._set_curve(us_zero)
+        self.totalUpdate()
+
+    @classmethod
+    def fromFrame(cls, bonds:pd.DataFrame, us_zero:pd.DataFrame,
+                  pricing_dt:date, freq:int=6) :
+        """
+        Build the book from a DataFrame indexed by id with the columns
+        maturity, cpn, cl_price and optionally call_dt (as Securities.bonds)
+        """
+        return cls(bonds['maturity'].tolist(), bonds['cpn'].values,
+                   bonds['cl_price'].values, us_zero, pricing_dt, freq,
+                   ids=bonds.index,
+                   call_dt=bonds['call_dt'].tolist() if 'call_dt' in bonds.columns else None)
+
+    def _set_curve(self, us_zero) :
+        # The spread solver consumes a CurveInterpolator, a zero DataFrame
+        # is compiled once against the pricing date
+        self._us_zero = us_zero
+        if isinstance(us_zero, CurveInterpolator) :
+            self._curve = us_zero
+        else :
+            self._curve = CurveInterpolator.fromFrame(us_zero, self._pricing_dt)
+
+    def totalUpdate(self) :
+        self._cash_flow()
+        self._calcAcc()
+        self._pv = self._cl_price + self._acc
+        self._y = np.full(self._coupon.shape[0], np.nan)
+        self._spread = np.full(self._coupon.shape[0], np.nan)
+        self._ytw = np.full(self._coupon.shape[0], np.nan)
+        self._stw = np.full(self._coupon.shape[0], np.nan)
+        self._calc_yield()
+        self._calc_spread()
+        self._calc_worst()
+        self._calc_risk()
+
+    def _stack_schedules(self) :
+        self._schedules = [get_schedule(m, c, self._freq)
+                           for m, c in zip(self._maturity, self._coupon)]
+        self._all_dates, self._all_flow = stack(self._schedules, self._pricing_dt)
+        self._cover_dt = np.datetime64(self._pricing_dt, 'D')
+
+    def _cash_flow(self) :
+        # Schedules are generated once, moving the pricing date only slices
+        # off past coupons and recomputes the days
+        _pricing_dt = np.datetime64(self._pricing_dt, 'D')
+        if not hasattr(self, '_schedules') or (_pricing_dt < self._cover_dt) :
+            self._stack_schedules()
+
+        mask = self._all_dates > _pricing_dt
+        alive = mask.any(axis=1)
+        first = mask.argmax(axis=1)
+        start = max(int(np.min(first[alive], initial=mask.shape[1])) - 1, 0)
+
+        self._mask = mask[:, start:]
+        self._dates = self._all_dates[:, start:]
+        self._days = np.where(self._mask, (self._dates - _pricing_dt).astype(int), 0)
+        self._flow = np.where(self._mask, self._all_flow[:, start:], 0.)
+
+        # Last coupon date before the pricing date (start of accrual period)
+        last_idx = np.where(alive, first - start - 1, 0)
+        self._last_acc = np.where(alive, self._dates[np.arange(self._dates.shape[0]), last_idx], _pricing_dt)
+
+    def _calcAcc(self) :
+        _pricing_dt = np.datetime64(self._pricing_dt, 'D')
+        acc_days = (_pricing_dt - self._last_acc).astype(int)
+        self._acc = self._coupon / self._n * acc_days / (365 / self._n)
+
+    def accrued(self, dates:list[date]) -> np.ndarray :
+        """
+        (dates x bonds) accrued interest for an array of dates
+        (zero once a bond has matured)
+        """
+        _dates = np.array(dates, dtype='datetime64[D]')
+        all_dates, _ = stack(self._schedules, _dates.min())
+        acc = np.zeros((_dates.shape[0], self._coupon.shape[0]))
+        for i in range(self._coupon.shape[0]) :
+            coupon_dts = all_dates[i][~np.isnat(all_dates[i])]
+            j = np.searchsorted(coupon_dts, _dates, side='right')
+            alive = j < coupon_dts.shape[0]
+            acc_days = (_dates - coupon_dts[np.maximum(j - 1, 0)]).astype(int)
+            acc[:, i] = np.where(alive, self._coupon[i] / self._n * acc_days / (365 / self._n), 0.)
+
+        return acc
+
+    def _periods(self) -> np.ndarray :
+        return self._days / (365 / self._n)
+
+    def _calc_yield(self, rows:np.ndarray=None) :
+
+        ## *** USING NEWTON RAPHSON METHOD (masked, all bonds at once) *****
+        # f(x) = sum ( flow / (1 + yield / n) ^ (days / (365 / n)) )
+        # f'(x) = sum ( - flow . k / n . (1 + yield / n) ^ (-k - 1) )
+        #        k = days / (365 / n)
+        # x1 = xo - fx / f'x
+        ## *****************************************************************
+
+        rows = np.arange(self._coupon.shape[0]) if rows is None else rows
+        self._y[rows] = self._solve_yield(self._periods()[rows], self._flow[rows],
+                                          self._pv[rows], self._coupon[rows] / 100)
+
+    def _solve_yield(self, k:np.ndarray, flow:np.ndarray, pv:np.ndarray, y:np.ndarray) -> np.ndarray :
+        y = y.copy()
+        active = (flow != 0).any(axis=1)
+        i = 0
+
+        while active.any() and (i <= YIELD_max_it) :
+            base = 1 + y[active, None] / self._n
+            fx = (flow[active] * base ** -k[active]).sum(axis=1) - pv[active]
+            dfx = (-flow[active] * k[active] / self._n * base ** (-k[active] - 1)).sum(axis=1)
+            y[active] = y[active] - fx / dfx
+
+            still = np.abs(fx) >= YIELD_e
+            active[active] = still
+            i += 1
+
+        y[~(flow != 0).any(axis=1)] = np.nan
+        return y
+
+    def _zero_yields(self) -> np.ndarray :
+        days = np.where(self._mask, self._days, 1)
+        return np.where(self._mask, self._curve.zero_y(days), 0.)
+
+    def _calc_spread(self, rows:np.ndarray=None) :
+
+        ## *** USING NEWTON RAPHSON METHOD (masked, all bonds at once) *****
+        # f(x) = sum ( flow / (1 + (z_yield + spread) * days / 360 ) )
+        # f'(x) = sum ( - flow . days / 360 / (1 + (z_yield + spread) * days / 360)^2 )
+        # x1 = xo - fx / f'x
+        ## *****************************************************************
+
+        rows = np.arange(self._coupon.shape[0]) if rows is None else rows
+        self._spread[rows] = self._solve_spread(self._zero_yields()[rows], self._days[rows] / 360,
+                                                self._flow[rows], self._pv[rows])
+
+    def _solve_spread(self, zero_y:np.ndarray, a:np.ndarray, flow:np.ndarray, pv:np.ndarray) -> np.ndarray :
+        spread = np.full(flow.shape[0], 0.01)
+        active = (flow != 0).any(axis=1)
+        i = 0
+
+        while active.any() and (i <= SPREAD_max_it) :
+            base = 1 + (zero_y[active] + spread[active, None]) * a[active]
+            fx = (flow[active] / base).sum(axis=1) - pv[active]
+            dfx = (-flow[active] * a[active] / base ** 2).sum(axis=1)
+            spread[active] = spread[active] - fx / dfx
+
+            still = np.abs(fx) > SPREAD_e
+            active[active] = still
+            i += 1
+
+        spread[~(flow != 0).any(axis=1)] = np.nan
+        return spread
+
+    def _calc_worst(self, rows:np.ndarray=None) :
+
+        ## *** YIELD AND SPREAD TO WORST (all candidates at once) **********
+        # candidates : every future coupon date from the call date, and maturity
+        # flows to a candidate : coupons up to it + 100 on it
+        # ytw = min ( yield to each candidate )
+        # stw = min ( spread to each candidate )
+        ## *****************************************************************
+
+        rows = np.arange(self._coupon.shape[0]) if rows is None else rows
+        self._ytw[rows] = self._y[rows]
+        self._stw[rows] = self._spread[rows]
+        selected = np.zeros(self._coupon.shape[0], dtype=bool)
+        selected[rows] = True
+        candidates = (selected[:, None] & self._mask & (self._dates >= self._call_dt[:, None])
+                      & (self._dates < self._maturity[:, None]))
+        bonds, cols = np.nonzero(candidates)
+        if bonds.shape[0] == 0 :
+            return
+
+        principal = np.where(self._mask & (self._dates == self._maturity[:, None]), 100., 0.)
+        flow = np.where(np.arange(self._flow.shape[1]) <= cols[:, None], (self._flow - principal)[bonds], 0.)
+        flow[np.arange(bonds.shape[0]), cols] += 100
+
+        y = self._solve_yield(self._periods()[bonds], flow, self._pv[bonds], self._coupon[bonds] / 100)
+        spread = self._solve_spread(self._zero_yields()[bonds], self._days[bonds] / 360, flow, self._pv[bonds])
+        np.fmin.at(self._ytw, bonds, y)
+        np.fmin.at(self._stw, bonds, spread)
+
+    def _discounted(self, y:np.ndarray) -> np.ndarray :
+        return self._flow / (1 + y[:, None] / self._n) ** self._periods()
+
+    def _calc_risk(self) :
+
+        ## *** CLOSED FORM FROM ONE DISCOUNTING PASS ***********************
+        # pv_i = flow / (1 + y / n) ^ k        k = days / (365 / n)
+        # macaulay = sum ( days / 365 . pv_i ) / P
+        # modified = macaulay / (1 + y / n)
+        # convexity = sum ( pv_i . k . (k + 1) ) / (n . (1 + y / n))^2 / P
+        # dv01 = modified . P . 1bp (x 1000)
+        ## *****************************************************************
+
+        k = self._periods()
+        base = 1 + self._y / self._n
+        pv_i = self._discounted(self._y)
+        pv = pv_i.sum(axis=1)
+
+        with np.errstate(invalid='ignore', divide='ignore') :
+            self._duration = (self._days * pv_i).sum(axis=1) / pv / 365
+            self._convexity = (pv_i * k * (k + 1)).sum(axis=1) / (self._n * base) ** 2 / pv
+        self._mod_duration = self._duration / base
+        self._dv01 = self._mod_duration * pv * DV01_bump * 1_000
+
+    def multiUpdate(self, new_pricing_dt:date, new_prices:list[float], new_us_zero) :
+        self._cl_price = np.asarray(new_prices, dtype=float).copy()
+        self._pricing_dt = new_pricing_dt
+        self._set_curve(new_us_zero)
+        self.totalUpdate()
+
+    def setPrice(self, pos:int, new_price:float) :
+        """
+        Reprice a single bond of the book with a new clean price
+        """
+        self.reprice(np.array([pos]), [new_price])
+
+    def reprice(self, rows:np.ndarray, new_prices:list[float]) :
+        """
+        Reprice some bonds of the book (positions rows) with new clean
+        prices, the solved factors of the other bonds are kept
+        """
+        rows = np.asarray(rows, dtype=int)
+        if rows.shape[0] == 0 :
+            return
+        self._cl_price[rows] = new_prices
+        self._pv[rows] = self._cl_price[rows] + self._acc[rows]
+        self._calc_yield(rows)
+        self._calc_spread(rows)
+        self._calc_worst(rows)
+        self._calc_risk()
+
+    def state(self) -> dict :
+        """
+        Copy of the prices and solved factors of the book (see restore)
+        """
+        state = {x : getattr(self, x).copy() for x in BOOK_state}
+        state.update({'pricing_dt' : self._pricing_dt, 'us_zero' : self._us_zero})
+        return state
+
+    def restore(self, state:dict) :
+        """
+        Back to a state of the book without solving anything (only the
+        cash flows of its pricing date are sliced again)
+        """
+        self._pricing_dt = state['pricing_dt']
+        self._set_curve(state['us_zero'])
+        self._cash_flow()
+        self._calcAcc()
+        for x in BOOK_state :
+            setattr(self, x, state[x].copy())
+
+    def copy(self, rows:np.ndarray=None) :
+        """
+        Independent book with the bonds at positions rows (all by default)
+        on the same date and curve, with their solved factors (nothing is
+        solved again)
+        """
+        rows = np.arange(self._coupon.shape[0]) if rows is None else np.asarray(rows, dtype=int)
+        book = BondBook.__new__(BondBook)
+        book.__dict__.update(self.__dict__)
+        for x in BOOK_arrays :
+            setattr(book, x, getattr(self, x)[rows].copy())
+        book._ids = self._ids[rows]
+        book._schedules = [self._schedules[i] for i in rows]
+        return book
+
+    def setYield(self, pos:int, new_y:float) :
+        """
+        Reprice a single bond of the book from a new yield
+        """
+        rows = np.array([pos])
+        self._y[pos] = new_y
+        self._pv[pos] = self._discounted(self._y)[pos].sum()
+        self._cl_price[pos] = self._pv[pos] - self._acc[pos]
+        self._calc_spread(rows)
+        self._calc_worst(rows)
+        self._calc_risk()
+
+    def revalue(self, curve_shift:np.ndarray, spread_shift:np.ndarray=None,
+                rows:np.ndarray=None) -> np.ndarray :
+        """
+        (scenarios x bonds) dirty prices with the zero rates of the curve
+        pillars and the spreads shifted, all the scenarios in one pass
+        :parameters:
+            curve_shift : np.ndarray (scenarios x pillars),
+                Shift of the zero rate of each pillar of the curve (in bp)
+            spread_shift : np.ndarray (scenarios x bonds) (Optional),
+                Shift of the spread of each bond (in bp)
+            rows : np.ndarray (Optional),
+                Positions of the bonds to revalue (all by default)
+        """
+
+        ## *** FULL REVALUATION (all scenarios and bonds at once) **********
+        # df_p = 1 / (1 / df_p + shift . days_p / 365)      (pillars)
+        # df = linear between pillars (flat outside), as CurveInterpolator
+        # P = sum ( flow / (1 / df + (spread + shift) . days / 360) )
+        # unshifted, 1 / df = 1 + z_yield . days / 360 gives the book price
+        ## *****************************************************************
+
+        rows = np.arange(self._coupon.shape[0]) if rows is None else np.asarray(rows)
+        curve_shift = np.atleast_2d(np.asarray(curve_shift, dtype=float)) / 10_000
+        spread_shift = (np.zeros((curve_shift.shape[0], rows.shape[0])) if spread_shift is None
+                        else np.atleast_2d(np.asarray(spread_shift, dtype=float)) / 10_000)
+
+        pillars = self._curve.days
+        dfs = 1 / (1 / self._curve.dfs + curve_shift * pillars / 365)
+
+        days = self._days[rows]
+        idx = np.clip(np.searchsorted(pillars, days, side='right'), 1, pillars.shape[0] - 1)
+        w = np.clip((days - pillars[idx - 1]) / (pillars[idx] - pillars[idx - 1]), 0, 1)
+        df = dfs[:, idx - 1] * (1 - w) + dfs[:, idx] * w
+
+        spread = np.nan_to_num(self._spread[rows])[None, :] + spread_shift
+        base = 1 / df + spread[:, :, None] * (days / 360)
+
+        return (self._flow[rows] / base).sum(axis=2)
+
+    def keyRates(self, rows:np.ndarray=None) -> pd.DataFrame :
+        """
+        (bonds x pillars) key rate dv01 : price change (x 1000, as dv01) for
+        a 1bp rise of the zero rate of each pillar of the curve alone.
+        Bonds are revalued by chunks, all the pillars at once
+        """
+        rows = np.arange(self._coupon.shape[0]) if rows is None else np.asarray(rows)
+        bp = DV01_bump * 10_000
+        shifts = np.vstack([np.zeros(self._curve.days.shape[0]),
+                            np.eye(self._curve.days.shape[0]) * bp])
+        key_rates = np.zeros((rows.shape[0], self._curve.days.shape[0]))
+        for start in range(0, rows.shape[0], KEYRATE_chunk) :
+            chunk = rows[start:start + KEYRATE_chunk]
+            prices = self.revalue(shifts, rows=chunk)
+            key_rates[start:start + KEYRATE_chunk] = (prices[0] - prices[1:]).T / bp * 1_000
+
+        return pd.DataFrame(key_rates, index=self._ids[rows],
+                            columns=pd.Index(self._curve.days.astype(int), name='days'))
+
+    def cshf(self, pos:int) -> pd.DataFrame :
+        """
+        Future cash flows of a single bond (dates, flow, days)
+        """
+        mask = self._mask[pos]
+        _cshf = pd.DataFrame({'flow' : self._flow[pos, mask],
+                              'days' : self._days[pos, mask]},
+                             index=pd.Index([x.item() for x in self._dates[pos, mask]], name='dates'))
+        return _cshf
+
+    def flows(self) -> tuple :
+        """
+        Future (bonds x flows) dates, coupons and principal, padded with NaT / 0
+        """
+        principal = np.where(self._mask & (self._dates == self._maturity[:, None]), 100., 0.)
+        dates = np.where(self._mask, self._dates, np.datetime64('NaT'))
+
+        return dates, self._flow - principal, principal
+
+    def bond(self, pos) :
+        """
+        Bond view over the position (or id) of the book
+        """
+        from .bond import Bond
+        if not isinstance(pos, (int, np.integer)) :
+            pos = self._ids.get_loc(pos)
+        return Bond.view(self, pos)
+
+    @property
+    def data(self) -> pd.DataFrame :
+        return pd.DataFrame({'cl_price' : self._cl_price,
+                             'price' : self._pv,
+                             'yield' : self._y * 100,
+                             'spread' : self._spread * 10000,
+                             'ytw' : self._ytw * 100,
+                             'stw' : self._stw * 10000,
+                             'dur' : self._duration,
+                             'mod_dur' : self._mod_duration,
+                             'convexity' : self._convexity,
+                             'dv01' : self._dv01},
+                            index=self._ids)
+
+    @property
+    def ids(self) :
+        return self._ids
+
+    @property
+    def cl_price(self) :
+        return self._cl_price
+
+    @property
+    def acc(self) :
+        return self._acc
+
+    @property
+    def price(self) :
+        return self._pv
+
+    @property
+    def y(self) :
+        return self._y
+
+    @property
+    def spread(self) :
+        return self._spread
+
+    @property
+    def ytw(self) :
+        return self._ytw
+
+    @property
+    def stw(self) :
+        return self._stw
+
+    @property
+    def call_dt(self) :
+        return self._call_dt
+
+    @property
+    def duration(self) :
+        return self._duration
+
+    @property
+    def mod_duration(self) :
+        return self._mod_duration
+
+    @property
+    def convexity(self) :
+        return self._convexity
+
+    @property
+    def dv01(self) :
+        return self._dv01
+
+    @property
+    def curve(self) :
+        return self._curve
+
+    @property
+    def us_zero(self) :
+        return self._us_zero
+    @us_zero.setter
+    def us_zero(self, new_zero) :
+        self._set_curve(new_zero)
+        self._calc_spread()
+        self._calc_worst()
+
+    @property
+    def pricing_dt(self) :
+        return self._pricing_dt
+    @pricing_dt.setter
+    def pricing_dt(self, new_dt:date) :
+        self._pricing_dt = new_dt
+        self.totalUpdate()
@@ -1,3 +1,4 @@
+import pandas as pd
 from datetime import date
 
 from .bond import Bond
@@ -12,8 +13,9 @@ class Future :
 
 class USTFuture(Future) :
     
-    def __init__(self, code:str) :
+    def __init__(self, code:str, us_zero:pd.DataFrame) :
         Future.__init__(self, code)
+        self._us_zero = us_zero
         self.CTD()
         self._ctd.cf = self.CF(self._ctd)
         self.dv01()
@@ -23,7 +25,7 @@ class USTFuture(Future) :
         _cpn = 2.625
         _price = 95.0078095
         pricing_dt = date(2023, 3, 31)
-        self._ctd = Bond(_mat, _cpn, _price, pricing_dt)
+        self._ctd = Bond(_mat, _cpn, _price, self._us_zero, pricing_dt)
         
     def CF(self, bond:Bond) -> float:
         _tempY = bond.y
@@ -37,4 +39,13 @@ class USTFuture(Future) :
         _tempP = self._ctd.cl_price
         self._ctd.cl_price = _price
         self._dv01 = self._ctd.dv01
-        self._ctd.cl_price = _tempP
\ No newline at end of file
+        self._keyRates = self._ctd.book.keyRates().iloc[0] / self._ctd.cf
+        self._ctd.cl_price = _tempP
+    
+    @property
+    def keyRates(self) -> pd.Series :
+        """
+        Key rate dv01 of the CTD per pillar of the zero curve, over the
+        conversion factor (to size hedges against Bonds.key_rates)
+        """
+        return self._keyRates
\ No newline at end of file
@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import pandas as pd
+import numpy as np
+
+MASTER_categoricals = ['asset_class', 'currency', 'sector', 'rating']
+
+class SecurityMaster :
+
+    def __init__(self, tables:dict) :
+        """
+        Every security in one table keyed by a dense integer security id
+        (sid, its position in the master), descriptive columns kept as
+        categoricals and prices in one float array. Any join on securities
+        is a get_indexer into sids and then array indexing
+        :parameters:
+            tables : dict,
+                Name (source) : pd.DataFrame indexed by id, in the order of
+                the sids (e.g. bonds, equities, funds, options)
+
+        :methods:
+            sid : sids of ids (-1 for unknown ids)
+
+            take : values of a column (categorical or price) for sids
+
+            setPrices : prices of the securities of a source
+
+            frame : pd.DataFrame view of the master
+        """
+        ids = []
+        self._slices = {}
+        for name, table in tables.items() :
+            self._slices[name] = slice(len(ids), len(ids) + table.shape[0])
+            ids.extend(table.index)
+        self._ids = pd.Index(ids, name='id')
+        if not self._ids.is_unique :
+            raise ValueError(f'Duplicated security ids {list(self._ids[self._ids.duplicated()].unique())}')
+
+        self._columns = {'source' : pd.Categorical(np.repeat(list(tables), [x.shape[0] for x in tables.values()]),
+                                                   categories=list(tables))}
+        for column in MASTER_categoricals :
+            self._columns[column] = pd.Categorical(np.concatenate(
+                [table[column].values.astype(object) if column in table.columns else np.full(table.shape[0], np.nan, dtype=object)
+                 for table in tables.values()]))
+        self._price = np.full(self._ids.shape[0], np.nan)
+
+    def sid(self, ids:list) -> np.ndarray :
+        return self._ids.get_indexer(ids)
+
+    def take(self, column:str, sids:np.ndarray) :
+        """
+        Values of column for sids : pd.Categorical for the categorical
+        columns, np.ndarray for price (missing for sids -1)
+        """
+        sids = np.asarray(sids, dtype=int)
+        if column == 'price' :
+            return np.where(sids >= 0, self._price[np.maximum(sids, 0)], np.nan)
+        values = self._columns[column]
+        codes = np.where(sids >= 0, values.codes[np.maximum(sids, 0)], -1)
+        return pd.Categorical.from_codes(codes, dtype=values.dtype)
+
+    def setPrices(self, name:str, prices:np.ndarray) :
+        self._price[self._slices[name]] = prices
+
+    def slice(self, name:str) -> slice :
+        return self._slices[name]
+
+    @property
+    def ids(self) :
+        return self._ids
+
+    @property
+    def prices(self) -> pd.Series :
+        return pd.Series(self._price.copy(), index=self._ids, name='price')
+
+    @property
+    def frame(self) -> pd.DataFrame :
+        frame = pd.DataFrame(self._columns, index=self._ids)
+        frame['price'] = self._price
+        return frame
@@ -2,14 +2,21 @@
 # -*- coding: utf-8 -*-
 
 import scipy.stats
+import numpy as np
+import pandas as pd
+from scipy.special import ndtr
 from numpy import sqrt, log, exp, pi
 from datetime import date
 
 GAMMA = 0.05
 VEGA_m = 5
 VEGA_e = VEGA_m * 0.01
-IMP_VOL_e = 0.01 # diff in price
-IMP_VOL_max_it = 20
+IMP_VOL_e = 1e-8 # diff in price
+IMP_VOL_max_it = 50
+IMP_VOL_min = 1e-4
+IMP_VOL_max = 5.
+SPY_r = 0.03
+SPY_i = 0.01
 
 class Option :
     
@@ -89,6 +96,10 @@ class Option :
         print(f'Theta : {theta}')
     
     def calc_price(self):
+        self._price = self._model()
+    
+    def _model(self) -> float :
+        # Black Scholes price at the current inputs, leaving the price as is
         N = scipy.stats.norm.cdf
         d1 = (log(self._S/self._K) + (self._r+self._vol**2/2)*self._t) / (self._vol*sqrt(self._t))
         d2 = d1 - self._vol * sqrt(self._t)
@@ -97,22 +108,10 @@ class Option :
         elif self._c_p == 'put':
             price = N(-d2) * self._K * exp(-self._r*self._t) - N(-d1) * self._S
         
-        self._price = price
+        return price
     
     def interpolateVol(self) :
-        _table = self.vol_surface.copy()
-        _table.loc[self._t, self._K/self._S-1] = np.NaN
-        _table = (_table[sorted(_table.columns)]
-                  .sort_index()
-                  .interpolate('slinear',
-                               fill_value='extrapolate',
-                               limit_direction='both',
-                               axis=0)
-                  .interpolate('slinear',
-                               fill_value='extrapolate',
-                               limit_direction='both',
-                               axis=1))
-        self._vol = _table.loc[_t, _money]
+        self._vol = float(self._vol_surface.interpolate(self._t, self._K / self._S - 1))
     
     @property
     def price(self) :
@@ -135,8 +134,6 @@ class Option :
     def spot(self, _spot):
         self._S = _spot
         try :
-            #Determining the Vol already updated Price and Greeks. 
-            # self.vol = self._vol_surface.interpolate(self._t, self._K / _spot - 1)
             self.interpolateVol()
             self.calc_price()
             self.calc_delta()
@@ -205,32 +202,28 @@ class Option :
         return self._gamma_down
 
     def calc_vega_up(self) :
-        price1 = self.price
+        price1 = self._model()
         self._vol += VEGA_e
-        self.calc_price()
-        price2 = self.price
+        price2 = self._model()
         
         self._vega_up = (price2-price1) / VEGA_m
         
         #Return to normal levels
         self._vol -= VEGA_e
-        self.calc_price()
     
     @property
     def vega_up(self) :
         return self._vega_up
     
     def calc_vega_down(self) :
-        price1 = self.price
+        price1 = self._model()
         self._vol -= VEGA_e
-        self.calc_price()
-        price2 = self.price
+        price2 = self._model()
         
         self._vega_down = (price2-price1) / VEGA_m
         
         #Return to normal levels
         self._vol += VEGA_e
-        self.calc_price()
 
     @property
     def vega_down(self) :
@@ -242,43 +235,26 @@ class Option :
     
     def calc_mod_theta(self) :
         d = 1
-        price1 = self._price
+        price1 = self._model()
         self._t = (self._t * 365 - d) / 365
-        self.calc_price()
-        price2 = self.price
+        price2 = self._model()
         
         self._theta = price2 - price1
         #Return to normal levels
         self._t = (self._t * 365 + d) / 365
-        self.calc_price()
         
     @property
     def theta(self) :
         return self._theta
             
     def calc_imp_vol(self) :
-        
-        ## *** USING NEWTON RAPHSON METHOD ***************************
-        # f(x) = price(vol)
-        # f'(x) = vega(vol)
-        # x1 = xo - fx / f'x
-        ## ***********************************************************
-
-        
-        fx = IMP_VOL_e * 2 # initial standard error
-        i = 0
-        y = self._vol
-        target_price = self._price
-        
-        while (abs(fx) >= IMP_VOL_e) & (i <= IMP_VOL_max_it):
+        vol, converged = OptionBook.impliedVol([self._price], [self._c_p], [self._S], [self._K],
+                                               [self._r], [self._t], [self._vol])
+        # Not converged : the quoted price is kept with the last vol
+        self._converged = bool(converged[0])
+        if self._converged :
+            self._vol = vol[0]
             self.calc_price()
-            fx = self._price - target_price
-            self.calc_vega_up()
-            self.calc_vega_down()
-            dfx = self.vega * 100
-              
-            self._vol = self._vol - fx / dfx
-            i += 1
         
     @property
     def vol(self) :
@@ -297,15 +273,12 @@ class Option :
 class SPYOption(Option) :
     
     def __init__(self, code:str, pricing_dt:date, price:float=None,
-                 spot:float=380, r:float=0.03, i:float=0.01, vol:float=0.25, vol_surface=None) :
+                 spot:float=380, r:float=SPY_r, i:float=SPY_i, vol:float=0.25, vol_surface=None,
+                 solve:bool=True) :
         # example code : SPY230317C00400000
+        # solve=False keeps vol as given (used when an OptionBook solves the vols in batch)
         self._code = code
-        if code[9] == 'C' :
-            self._c_p = 'call'
-        else : 
-            self._c_p = 'put'
-        self._K = float(code[-6:] ) / 1000
-        self._maturity = date(int('20'+code[3:5]), int(code[5:7]), int(code[7:9]))
+        self._c_p, self._K, self._maturity = self.parse(code)
         self._t = (self._maturity - pricing_dt).days/365
         
         #It doesn't matter in the creating because we will calculate the imp_vol based on the price given
@@ -315,10 +288,260 @@ class SPYOption(Option) :
         self._i = i
         self._S = spot
         self._vol_surface = vol_surface
-        self.price = price
+        if solve :
+            self.price = price
+        else :
+            self._price = price
 
+    @staticmethod
+    def parse(code:str) -> tuple :
+        """
+        Returns call or put, strike and maturity of a SPY option code
+        """
+        c_p = 'call' if code[9] == 'C' else 'put'
+        K = float(code[-6:] ) / 1000
+        maturity = date(int('20'+code[3:5]), int(code[5:7]), int(code[7:9]))
+        
+        return c_p, K, maturity
     
     @property
     def code(self) :
         return self._code
-    
\ No newline at end of file
+    
+class OptionBook :
+    
+    def __init__(self, c_p:list[str], S:list[float], K:list[float], r:list[float],
+                 t:list[float], vol:list[float], ids:list=None, converged:list[bool]=None) :
+        """
+        Prices a whole array of calls and puts at once (Black Scholes)
+        :parameters:
+            c_p: list, str, 
+                Call or Put 
+            S : list, float,
+                Spot prices
+            K : list, float,
+                Strike prices
+            r: list, float,
+                Base currency rates
+            t : list, float
+                Tenors
+            vol : list, float,
+                Volatilities annualised
+            ids : list (Optional),
+                Ids of the options, used as index of data
+            converged : list, bool (Optional),
+                Whether each vol was solved from a market price, by default
+                every vol that is not nan
+        :methods:
+            price, delta, gamma, vega, theta : analytic values
+            
+            gamma_up, gamma_down : delta change for a +/- 5% spot move
+            
+            vega_up, vega_down : price change per vol point for a +/- 5 vol points move
+            
+            mod_theta : price change for one day less to maturity
+        """
+        self._S, self._K, self._r, self._t, self._vol = [
+            np.array(x) for x in np.broadcast_arrays(*[np.asarray(x, dtype=float) for x in (S, K, r, t, vol)])]
+        self._call = np.broadcast_to(np.asarray(c_p) == 'call', self._S.shape)
+        self._ids = pd.Index(range(self._S.shape[0]) if ids is None else ids)
+        self._converged = ~np.isnan(self._vol) if converged is None else \
+            np.array(np.broadcast_to(np.asarray(converged, dtype=bool), self._S.shape))
+        self.calc()
+    
+    @classmethod
+    def fromPrices(cls, prices:list[float], c_p:list[str], S:list[float], K:list[float],
+                   r:list[float], t:list[float], vol:list[float]=0.25, ids:list=None) :
+        """
+        Book priced at the implied volatilities of the given prices
+        """
+        _vol, converged = cls.impliedVol(prices, c_p, S, K, r, t, vol)
+        return cls(c_p, S, K, r, t, _vol, ids, converged)
+    
+    @staticmethod
+    def impliedVol(prices:list[float], c_p:list[str], S:list[float], K:list[float],
+                   r:list[float], t:list[float], vol:list[float]=0.25) -> tuple :
+        """
+        Implied volatilities of arrays of option prices
+        :returns:
+            vol : np.ndarray, implied volatilities (the starting vol where
+                not converged : vol given, 0.25 without one)
+            converged : np.ndarray, bool
+        """
+        
+        ## *** SAFEGUARDED NEWTON RAPHSON METHOD (all options at once) *****
+        # f(x) = price(vol) - target
+        # f'(x) = vega(vol) (analytic)
+        # x1 = xo - fx / f'x, falling back to bisection outside the bracket
+        ## *****************************************************************
+        
+        target = np.asarray(prices, dtype=float)
+        call = np.asarray(c_p) == 'call'
+        S, K, r, t, target = np.broadcast_arrays(*[np.asarray(x, dtype=float) for x in (S, K, r, t, target)])
+        x = np.array(np.broadcast_to(np.asarray(vol, dtype=float), target.shape))
+        x = np.where(np.isnan(x), 0.25, np.clip(x, IMP_VOL_min, IMP_VOL_max))
+        start = x.copy()
+        lo = np.full(target.shape, IMP_VOL_min)
+        hi = np.full(target.shape, IMP_VOL_max)
+        fx = np.full(target.shape, np.inf)
+        active = ~np.isnan(target) & (t > 0)
+        i = 0
+        
+        while active.any() and (i <= IMP_VOL_max_it) :
+            price = OptionBook.bs_price(call, S, K, r, t, x)
+            fx = np.where(active, price - target, fx)
+            
+            # Without vega (deep out of the money, expiring) the step is left to the bisection
+            with np.errstate(invalid='ignore', divide='ignore', over='ignore') :
+                d1 = (log(S/K) + (r+x**2/2)*t) / (x*sqrt(t))
+                vega = S * exp(-d1**2 / 2) / sqrt(2 * pi) * sqrt(t)
+                step = x - np.divide(fx, vega, out=np.full(x.shape, np.nan), where=vega > 0)
+            
+            hi = np.where(active & (fx > 0), x, hi)
+            lo = np.where(active & (fx < 0), x, lo)
+            bisect = ~((step > lo) & (step < hi))
+            x = np.where(active, np.where(bisect, (lo + hi) / 2, step), x)
+            
+            active &= np.abs(fx) >= IMP_VOL_e
+            i += 1
+        
+        converged = np.abs(fx) < IMP_VOL_e
+        
+        return np.where(converged, x, start), converged
+    
+    def updateOptions(self, options:list[Option], prices:list[float]=None) :
+        """
+        Writes the book values back into the Option objects
+        (same order as the book). Options whose vol did not converge keep
+        their market price (prices, or their own) and get the greeks of
+        the fallback vol
+        """
+        for i, opt in enumerate(options) :
+            opt._S = self._S[i]
+            opt._t = self._t[i]
+            opt._vol = self._vol[i]
+            if self._converged[i] :
+                opt._price = self._price[i]
+            elif prices is not None :
+                opt._price = prices[i]
+            opt._delta = self._delta[i]
+            opt._gamma_up = self._gamma_up[i]
+            opt._gamma_down = self._gamma_down[i]
+            opt._vega_up = self._vega_up[i]
+            opt._vega_down = self._vega_down[i]
+            opt._theta = self._mod_theta[i]
+            opt._converged = self._converged[i]
+    
+    @classmethod
+    def fromOptions(cls, options:list[Option], ids:list=None) :
+        return cls([x._c_p for x in options], [x._S for x in options],
+                   [x._K for x in options], [x._r for x in options],
+                   [x._t for x in options], [x._vol for x in options], ids)
+    
+    def calc(self) :
+        self._price = self.bs_price(self._call, self._S, self._K, self._r, self._t, self._vol)
+        self._delta = self.bs_delta(self._call, self._S, self._K, self._r, self._t, self._vol)
+        
+        with np.errstate(invalid='ignore', divide='ignore') :
+            sqrt_t = sqrt(self._t)
+            d1 = (log(self._S/self._K) + (self._r+self._vol**2/2)*self._t) / (self._vol*sqrt_t)
+            d2 = d1 - self._vol * sqrt_t
+            n_d1 = exp(-d1**2 / 2) / sqrt(2 * pi)
+            
+            self._gamma = n_d1 / (self._S * self._vol * sqrt_t)
+            self._vega = self._S * n_d1 * sqrt_t / 100
+            sign = np.where(self._call, 1, -1)
+            self._theta = (- self._S * n_d1 * self._vol / (2 * sqrt_t)
+                           - sign * self._r * self._K * exp(-self._r*self._t) * ndtr(sign * d2)) / 365
+        
+        #Finite differences with the same bumps as Option
+        self._gamma_up = self.bs_delta(self._call, self._S*(1+GAMMA), self._K, self._r, self._t, self._vol) - self._delta
+        self._gamma_down = self._delta - self.bs_delta(self._call, self._S*(1-GAMMA), self._K, self._r, self._t, self._vol)
+        self._vega_up = (self.bs_price(self._call, self._S, self._K, self._r, self._t, self._vol+VEGA_e) - self._price) / VEGA_m
+        self._vega_down = (self.bs_price(self._call, self._S, self._K, self._r, self._t, self._vol-VEGA_e) - self._price) / VEGA_m
+        self._mod_theta = self.bs_price(self._call, self._S, self._K, self._r, self._t - 1/365, self._vol) - self._price
+    
+    @staticmethod
+    def bs_price(call:np.ndarray, S:np.ndarray, K:np.ndarray, r:np.ndarray,
+                 t:np.ndarray, vol:np.ndarray) -> np.ndarray :
+        with np.errstate(invalid='ignore', divide='ignore') :
+            d1 = (log(S/K) + (r+vol**2/2)*t) / (vol*sqrt(t))
+            d2 = d1 - vol * sqrt(t)
+            return np.where(call,
+                            ndtr(d1) * S - ndtr(d2) * K * exp(-r*t),
+                            ndtr(-d2) * K * exp(-r*t) - ndtr(-d1) * S)
+    
+    @staticmethod
+    def bs_delta(call:np.ndarray, S:np.ndarray, K:np.ndarray, r:np.ndarray,
+                 t:np.ndarray, vol:np.ndarray) -> np.ndarray :
+        with np.errstate(invalid='ignore', divide='ignore') :
+            d1 = (log(S/K) + (r+vol**2/2)*t) / (vol*sqrt(t))
+            return np.where(call, ndtr(d1), ndtr(d1) - 1)
+    
+    @property
+    def data(self) -> pd.DataFrame :
+        return pd.DataFrame({'price' : self._price,
+                             'tenor' : self._t,
+                             'c_p' : np.where(self._call, 'call', 'put'),
+                             'strike' : self._K,
+                             'spot' : self._S,
+                             'vol' : self._vol,
+                             'converged' : self._converged,
+                             'delta' : self._delta,
+                             'gamma' : self._gamma,
+                             'vega' : self._vega,
+                             'theta' : self._theta,
+                             'gamma_up' : self._gamma_up,
+                             'gamma_down' : self._gamma_down,
+                             'vega_up' : self._vega_up,
+                             'vega_down' : self._vega_down,
+                             'mod_theta' : self._mod_theta},
+                            index=self._ids)
+    
+    @property
+    def price(self) :
+        return self._price
+    
+    @property
+    def vol(self) :
+        return self._vol
+    
+    @property
+    def converged(self) :
+        return self._converged
+    
+    @property
+    def delta(self) :
+        return self._delta
+    
+    @property
+    def gamma(self) :
+        return self._gamma
+    
+    @property
+    def vega(self) :
+        return self._vega
+    
+    @property
+    def theta(self) :
+        return self._theta
+    
+    @property
+    def gamma_up(self) :
+        return self._gamma_up
+    
+    @property
+    def gamma_down(self) :
+        return self._gamma_down
+    
+    @property
+    def vega_up(self) :
+        return self._vega_up
+    
+    @property
+    def vega_down(self) :
+        return self._vega_down
+    
+    @property
+    def mod_theta(self) :
+        return self._mod_theta
@@ -23,15 +23,15 @@ class Portfolio(Reports, Performance) :
     
     @property
     def bonds(self):
-        return self._bonds
+        return self._snapshot.bonds
                 
     @property
     def equities(self):
-        return self._equities
+        return self._snapshot.equities
     
     @property
     def options(self) :
-        return self._options
+        return self._snapshot.options
         
     @property
     def cash(self):
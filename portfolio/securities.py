@@ -2,20 +2,40 @@
 # -*- coding: utf-8 -*-
 
 import pandas as pd
+import numpy as np
+from collections import OrderedDict
 from datetime import datetime as dt
 from datetime import date
 
-from .bond import Bond
-from .options import SPYOption
+from .bond_book import BondBook
+from .master import SecurityMaster
+from .options import SPYOption, OptionBook
+from .utils.graph import DependencyGraph
+from .utils.price_store import PriceStore
+from .utils.fx import FxEngine, FX_currencies
+
+REPRICE_cache = 32 # pricing dates of solved bonds and options kept for reuse
 
 class Securities:
     """
     Main Class that gathers basic information about a list of possible securities
     """
 
-    def __init__(self, AC:list[pd.DataFrame], hist:pd.DataFrame, initial_pricing_dt:date, curves, volatilities) :
+    def __init__(self, AC:list[pd.DataFrame], hist:pd.DataFrame, initial_pricing_dt:date, curves, volatilities,
+                 asof:str='nearest', currencies:dict=FX_currencies) :
+        """
+        :parameters:
+            hist : pd.DataFrame or PriceStore,
+                Price history (dates x ids)
+            asof : str,
+                Price of a date in the history : 'nearest', 'last' or 'prior'
+                (see PriceStore)
+            currencies : dict,
+                Currency : code of its USD rate in the history (see FxEngine)
+        """
         self._pricing_dt = initial_pricing_dt
-        self._hist = hist
+        self._store = hist if isinstance(hist, PriceStore) else PriceStore(hist)
+        self._asof = asof
         self._curves = curves
         self._volatilities = volatilities
         
@@ -23,93 +43,344 @@ class Securities:
         self._equities = AC['equities']
         self._funds = AC['funds']
         self._options = AC['options']
+        self._master = SecurityMaster({'bonds' : self._bonds, 'equities' : self._equities,
+                                       'funds' : self._funds, 'options' : self._options})
+        
+        self._fxEngine = FxEngine(self._store, currencies, asof)
+        self._fx = pd.DataFrame({'code' : self._fxEngine.codes},
+                                index=pd.Index(self._fxEngine.currencies, name='id'))
+        self._buildUniverse()
         
+        self._inputs = 0
+        self._generation = 0 # increases with every input, never reset
+        self._overrides = {} # pricing date : prices, curve and generation of its last input
+        self._solved = {'bonds' : OrderedDict(), 'options' : OrderedDict()}
+        self._repriced = {'bonds' : (0, 0), 'options' : (0, 0)}
         self.last_prices()
         self.initial_setup()
+        self._buildGraph()
         
+    def _buildUniverse(self) :
+        # Every security of the master (in sid order) and fx code, with its
+        # default without history, in one array so each price update is a single gather
+        defaults = {'bonds' : 100., 'equities' : 0., 'funds' : 0., 'options' : 1.}
+        n = self._master.ids.shape[0]
+        self._universe = self._master.ids.append(pd.Index(self._fx['code']))
+        self._slices = {name : self._master.slice(name) for name in defaults}
+        self._slices['fx'] = slice(n, self._universe.shape[0])
+        self._defaults = np.ones(self._universe.shape[0])
+        for name, default in defaults.items() :
+            self._defaults[self._slices[name]] = default
+    
     def last_prices(self) :
-        idx = self._hist.index.get_indexer([self._pricing_dt], method='nearest')
-        self._last_prices = self._hist.iloc[idx]
+        self._last_prices = pd.Series(self._store.prices(self._pricing_dt, how=self._asof), index=self._store.ids)
+        self._applyPrices(self._overrides.get(self._pricing_dt, {}).get('prices', {}))
+        self._gather()
+    
+    def _applyPrices(self, prices:dict) :
+        if len(prices) > 0 :
+            self._last_prices = self._last_prices.copy()
+            for _id, p in prices.items() :
+                self._last_prices[_id] = p
+    
+    def _override(self) -> dict :
+        if self._pricing_dt not in self._overrides :
+            self._overrides[self._pricing_dt] = {'prices' : {}, 'curve' : None, 'inputs' : 0}
+        self._generation += 1
+        self._overrides[self._pricing_dt]['inputs'] = self._generation
+        self._inputs = self._generation
+        return self._overrides[self._pricing_dt]
+    
+    def _gather(self) :
+        pos = self._last_prices.index.get_indexer(self._universe)
+        self._prices = np.where(pos >= 0, self._last_prices.values[np.maximum(pos, 0)], self._defaults)
         
     def initial_setup(self) :
-        self._bonds['cl_price'] = self._bonds.apply(lambda x: self._last_prices[x.name]
-                                         if x.name in self._last_prices.columns else 100,
-                                         axis=1)
-        self._bonds['Bond'] = self._bonds.apply(lambda x: Bond(x['maturity'], x['cpn'], x['cl_price'], self._curves.zero, self._pricing_dt), axis=1)
-        self._bonds[['price', 'yield', 'spread', 'dur']] = self._bonds.apply(lambda x: 
-                                                                pd.Series([x['Bond'].price,
-                                                                           x['Bond'].y * 100,
-                                                                           x['Bond'].spread * 10000,
-                                                                           x['Bond'].duration],
-                                                                          index=['price', 'yield', 'spread', 'duration']),
-                                                                             axis=1)
+        self._curve = self._curves.interpolator
+        self._updateBondPrices()
+        self._bondBook = BondBook.fromFrame(self._bonds, self._curve, self._pricing_dt)
+        self._bonds['Bond'] = [self._bondBook.bond(i) for i in range(self._bonds.shape[0])]
+        self._remember('bonds', self._bondBook.state())
+        self._repriced['bonds'] = (self._bonds.shape[0], 0)
+        self.updateBonds()
         
-        self._equities['price'] = self._equities.apply(lambda x: self._last_prices[x.name]
-                                                   if x.name in self._last_prices.columns else 0, axis=1)
+        self._updateEquityPrices()
+        self._updateFx()
         
+        self._updateSpot()
+        self._volatilities.pricing_dt = self._pricing_dt
+        self._updateOptionPrices()
+        self._options['Option'] = [SPYOption(code, self._pricing_dt, price=p, spot=self._spot,
+                                             vol_surface=self._volatilities, solve=False)
+                                   for code, p in zip(self._options.index, self._options['price'])]
+        self._updateOptionGreeks()
         
-        self._funds['price'] = self._funds.apply(lambda x: self._last_prices[x.name]
-                                             if x.name in self._last_prices.columns else 0, axis=1)
+        self._updateMaster()
         
+    def _buildGraph(self) :
+        """
+        Market inputs and the analytics depending on them, every node is
+        recomputed only when one of its inputs changed
+        """
+        self._graph = DependencyGraph()
+        self._graph.addNode('prices', self.last_prices)
+        self._graph.addNode('curves', self._updateCurves)
+        self._graph.addNode('vol_surface', self._updateVolSurface)
+        self._graph.addNode('fx', self._updateFx, ['prices'])
+        self._graph.addNode('bond_prices', self._updateBondPrices, ['prices'])
+        self._graph.addNode('equity_prices', self._updateEquityPrices, ['prices'])
+        self._graph.addNode('option_prices', self._updateOptionPrices, ['prices'])
+        self._graph.addNode('spot', self._updateSpot, ['equity_prices'])
+        self._graph.addNode('bond_analytics', self._updateBondAnalytics, ['bond_prices', 'curves'])
+        self._graph.addNode('option_greeks', self._updateOptionGreeks, ['option_prices', 'spot'])
+        self._graph.addNode('master', self._updateMaster, ['bond_analytics', 'equity_prices', 'option_prices'])
         
-        self._fx = pd.DataFrame({'id': ['USD', 'EUR', 'CHF', 'CAD', 'BRL', 'GBP'],
-                                 'code' : ['USD', 'EUR=X', 'CHF=X', 'CAD=X', 'BRL=X', 'GBP=X']},
-                              index=['USD', 'EUR=X', 'CHF=X', 'CAD=X', 'BRL=X', 'GBP=X'])
+    def update(self) :
+        """
+        Recomputes every node for the current pricing date
+        """
+        self._graph.invalidate('prices', 'curves', 'vol_surface')
+        self.refresh()
+    
+    def refresh(self) -> list[str] :
+        """
+        Recomputes the dirty nodes only and returns their names
+        """
+        return self._graph.refresh()
+    
+    def setPrices(self, prices:dict) :
+        """
+        Overrides the last prices of some securities on the current pricing
+        date and recomputes only what depends on them. Overrides are kept
+        per date and applied again whenever the securities are priced on
+        that date (see clearInputs)
+        """
+        ids = pd.Index(list(prices))
+        self._override()['prices'].update(prices)
+        self._applyPrices(prices)
+        self._gather()
         
+        nodes = [node for node, universe in [('bond_prices', self._bonds.index),
+                                             ('equity_prices', self._equities.index.append(self._funds.index)),
+                                             ('fx', pd.Index(self._fx['code'])),
+                                             ('option_prices', self._options.index)]
+                 if ids.isin(universe).any()]
+        self._graph.invalidate(*nodes)
         
-        self._fx['price'] = self._fx.apply(lambda x: self._last_prices[x.name][0]
-                                       if x.name in self._last_prices.columns else 1, axis=1)
-        self._fx.set_index('id', inplace=True)
+        return self.refresh()
+    
+    def setSpot(self, spot:float) :
+        return self.setPrices({'SPY' : spot})
+    
+    def setCurves(self, curves=None) :
+        """
+        New curves for the current pricing date (or the same object updated
+        in place), only the bond analytics are recomputed. The curve is kept
+        for the date as the price overrides
+        """
+        if curves is not None :
+            self._curves = curves
+        self._curve = self._curves.interpolator
+        self._override()['curve'] = self._curve
+        self._graph.touch('curves')
         
-        SPYSpot = self._funds.loc['SPY', 'price']
+        return self.refresh()
+    
+    def clearInputs(self, pricing_dt:date=None) :
+        """
+        Drops the prices and curve set on pricing_dt (default the current
+        date), back to the history
+        """
+        pricing_dt = self._pricing_dt if pricing_dt is None else pricing_dt
+        if self._overrides.pop(pricing_dt, None) is not None and pricing_dt == self._pricing_dt :
+            self._inputs = 0
+            self.update()
+    
+    def inputs(self, pricing_dt:date=None) -> int :
+        """
+        Generation of the last input set on pricing_dt (default the current
+        date), 0 without inputs : a new input never reuses a past value
+        """
+        pricing_dt = self._pricing_dt if pricing_dt is None else pricing_dt
+        return self._overrides.get(pricing_dt, {}).get('inputs', 0)
+    
+    def _price(self, name:str) -> np.ndarray :
+        return self._prices[self._slices[name]]
+    
+    def _updateCurves(self) :
+        self._curves.pricing_dt = self._pricing_dt
+        curve = self._overrides.get(self._pricing_dt, {}).get('curve')
+        self._curve = self._curves.interpolator if curve is None else curve
+    
+    def _updateVolSurface(self) :
         self._volatilities.pricing_dt = self._pricing_dt
-        self._options['price'] = self._options.apply(lambda x: self._last_prices[x.name]
-                                         if x.name in self._hist.columns else 1,
-                                         axis=1)
-        self._options['Option'] = self._options.apply(lambda x: 
-                                                      SPYOption(x.name,
-                                                                self._pricing_dt,
-                                                                price=x['price'],
-                                                                spot=SPYSpot, 
-                                                                vol_surface=self._volatilities),
-                                                      axis=1)
-        
-        self._id_all = pd.concat([self._funds[['asset_class', 'currency', 'price']],
-                                  self._equities[['asset_class', 'currency', 'price']],
-                                  self._bonds[['asset_class', 'currency', 'price']],
-                                  self._options[['asset_class', 'currency', 'price']]])
+    
+    def _updateFx(self) :
+        self._fx['price'] = self._price('fx')
+        self._fxEngine.setRates(self._fx['price'].values)
+    
+    def _updateBondPrices(self) :
+        self._bonds['cl_price'] = self._price('bonds')
+    
+    def _updateEquityPrices(self) :
+        self._equities['price'] = self._price('equities')
+        self._funds['price'] = self._price('funds')
+    
+    def _updateOptionPrices(self) :
+        self._options['price'] = self._price('options')
+    
+    def _updateSpot(self) :
+        self._spot = self._funds.loc['SPY', 'price']
+    
+    def _remember(self, name:str, solved:dict) :
+        self._solved[name][self._pricing_dt] = solved
+        self._solved[name].move_to_end(self._pricing_dt)
+        while len(self._solved[name]) > REPRICE_cache :
+            self._solved[name].popitem(last=False)
+    
+    @staticmethod
+    def _changed(new:np.ndarray, old:np.ndarray) -> np.ndarray :
+        return ~((new == old) | (np.isnan(new) & np.isnan(old)))
+    
+    def _updateBondAnalytics(self) :
+        # Bonds are solved again only when their price changed since the
+        # last solve on the same date and curve (current or remembered)
+        book = self._bondBook
+        prices = self._bonds['cl_price'].values.astype(float)
+        curve = self._curve
+        solved = self._solved['bonds'].get(self._pricing_dt)
+        if (book.pricing_dt == self._pricing_dt) and book.curve.equals(curve) :
+            dirty = np.flatnonzero(self._changed(prices, book.cl_price))
+            book.reprice(dirty, prices[dirty])
+        elif (solved is not None) and curve.equals(solved['us_zero']) :
+            book.restore(solved)
+            dirty = np.flatnonzero(self._changed(prices, book.cl_price))
+            book.reprice(dirty, prices[dirty])
+        else :
+            book.multiUpdate(self._pricing_dt, prices, curve)
+            dirty = np.arange(prices.shape[0])
         
-    def update(self) :
-        self._bonds['cl_price'] = self._bonds.apply(lambda x: self._last_prices[x.name]
-                                         if x.name in self._last_prices.columns else 100,
-                                         axis=1)
-        self._bonds.apply(lambda x: x['Bond'].multiUpdate(self._pricing_dt, x['price'], self._curves.zero), axis=1)
-        self._bonds[['cl_price', 'yield', 'spread', 'dur']] = self._bonds.apply(lambda x: 
-                                                                pd.Series([x['Bond'],
-                                                                           x['Bond'].y * 100,
-                                                                           x['Bond'].spread * 10000,
-                                                                           x['Bond'].duration],
-                                                                          index=['price', 'yield', 'spread', 'duration']), axis=1)
-        
-        self._equities['price'] = self._equities.apply(lambda x: self._last_prices[x.name]
-                                                   if x.name in self._last_prices.columns else 0, axis=1)
-                
-        self._funds['price'] = self._funds.apply(lambda x: self._last_prices[x.name]
-                                             if x.name in self._last_prices.columns else 0, axis=1)
-        
-        self._fx['price'] = self._fx.apply(lambda x: self._last_prices[x['code']][0]
-                                       if x['code'] in self._last_prices.columns else 1, axis=1)
-        
-        SPYSpot = self._funds.loc['SPY', 'price']
-        self._options['price'] = self._options.apply(lambda x: self._last_prices[x.name]
-                                         if x.name in self._hist.columns else 1,
-                                         axis=1)
-        self._options.apply(lambda x: x['Option'].multiUpdate(x['price'], SPYSpot, self._pricing_dt), axis=1)
-    
-        self._id_all = pd.concat([self._funds[['asset_class', 'currency', 'price']],
-                                  self._equities[['asset_class', 'currency', 'price']],
-                                  self._bonds[['asset_class', 'currency', 'price']],
-                                  self._options[['asset_class', 'currency', 'price']]])
+        self._repriced['bonds'] = (dirty.shape[0], prices.shape[0] - dirty.shape[0])
+        self._remember('bonds', book.state())
+        self.updateBonds()
+    
+    def _updateOptionGreeks(self) :
+        self.updateOptions(self._spot)
+    
+    def _updateMaster(self) :
+        self._master.setPrices('bonds', self._bonds['price'].values)
+        self._master.setPrices('equities', self._equities['price'].values)
+        self._master.setPrices('funds', self._funds['price'].values)
+        self._master.setPrices('options', self._options['price'].values)
+    
+    def updateBonds(self) :
+        """
+        Copy the analytics columns from the BondBook into the bonds table
+        """
+        self._bonds[['price', 'yield', 'spread', 'ytw', 'stw', 'dur', 'mod_dur', 'convexity']] = self._bondBook.data[['price', 'yield', 'spread', 'ytw', 'stw', 'dur', 'mod_dur', 'convexity']]
+    
+    def updateOptions(self, spot:float) :
+        """
+        Solves the implied vols and greeks of all the options in one OptionBook.
+        Vols solved on the same date, spot and price are reused, only the
+        options with a new price (or all on a new spot) are solved again.
+        Options without a solution keep their market price and converged
+        False, their greeks use the vol of the surface
+        """
+        options = self._options['Option'].tolist()
+        prices = self._options['price'].values.astype(float)
+        c_p = [x._c_p for x in options]
+        K = np.array([x._K for x in options], dtype=float)
+        r = np.array([x._r for x in options], dtype=float)
+        t = np.array([(x._maturity - self._pricing_dt).days / 365 for x in options], dtype=float)
+        vol = np.array([x._vol for x in options], dtype=float)
+        converged = np.zeros(prices.shape[0], dtype=bool)
+        
+        solved = self._solved['options'].get(self._pricing_dt)
+        dirty = np.ones(prices.shape[0], dtype=bool)
+        if (solved is not None) and (solved['spot'] == spot) :
+            dirty = self._changed(prices, solved['prices'])
+            vol[~dirty] = solved['vol'][~dirty]
+            converged[~dirty] = solved['converged'][~dirty]
+        
+        if dirty.any() :
+            vol[dirty], converged[dirty] = OptionBook.impliedVol(prices[dirty], np.array(c_p)[dirty], spot,
+                                                                 K[dirty], r[dirty], t[dirty], vol[dirty])
+            # Vols that did not converge fall back to the surface (else their last vol)
+            fallback = dirty & ~converged
+            if fallback.any() :
+                surface = np.asarray(self._volatilities.interpolate(t[fallback], K[fallback] / spot - 1), dtype=float)
+                vol[fallback] = np.where(np.isfinite(surface) & (surface > 0), surface, vol[fallback])
+        self._optionBook = OptionBook(c_p, spot, K, r, t, vol, ids=self._options.index, converged=converged)
+        self._optionBook.updateOptions(options, prices)
+        
+        self._repriced['options'] = (int(dirty.sum()), int((~dirty).sum()))
+        self._remember('options', {'spot' : spot, 'prices' : prices, 'vol' : vol, 'converged' : converged})
+    
+    def priceMatrix(self, dates:list[date], ids:list) -> np.ndarray :
+        """
+        (dates x ids) prices as update would set them on each date :
+        nearest history row, defaults for securities without history,
+        prices set on the date and dirty prices for the bonds
+        """
+        ids = pd.Index(ids)
+        default = np.select([ids.isin(self._bonds.index), ids.isin(self._options.index)], [100., 1.], 0.)
+        prices = self._store.matrix(dates, ids, self._asof, default)
+        for row, override in self._overridden(dates) :
+            cols = ids.get_indexer(list(override))
+            prices[row, cols[cols >= 0]] = np.array(list(override.values()), dtype=float)[cols >= 0]
+        
+        pos = self._bondBook.ids.get_indexer(ids)
+        prices[:, pos >= 0] += self._bondBook.accrued(dates)[:, pos[pos >= 0]]
+        
+        return prices
+    
+    def fxMatrix(self, dates:list[date], currencies:list[str]) -> np.ndarray :
+        """
+        (dates x currencies) USD / Currency prices on each date
+        (NaN for currencies out of the fx table)
+        """
+        fx = self._fxEngine.rates(currencies, dates)
+        codes = np.asarray(pd.Index(currencies).map(self._fx['code']), dtype=object)
+        for row, override in self._overridden(dates) :
+            for code, p in override.items() :
+                fx[row, codes == code] = p
+        
+        return fx
+    
+    def _overridden(self, dates:list[date]) -> list[tuple] :
+        # (row, prices) of the dates with prices set on them
+        overridden = {pd.Timestamp(x) : v['prices'] for x, v in self._overrides.items() if len(v['prices']) > 0}
+        if len(overridden) == 0 :
+            return []
+        return [(row, overridden[x]) for row, x in enumerate(pd.to_datetime(list(dates))) if x in overridden]
+    
+    @property
+    def repriced(self) -> pd.DataFrame :
+        """
+        Bonds and options solved again and reused by their last update
+        """
+        return pd.DataFrame(self._repriced, index=['repriced', 'skipped']).T
+    
+    @property
+    def store(self) :
+        return self._store
+    
+    @property
+    def fxEngine(self) :
+        return self._fxEngine
+    
+    @property
+    def optionBook(self) :
+        return self._optionBook
+    
+    @property
+    def bondBook(self) :
+        return self._bondBook
+    
+    @property
+    def volatilities(self) :
+        return self._volatilities
     
     @property
     def bonds(self) :
@@ -133,7 +404,26 @@ class Securities:
     
     @property
     def id_all(self) :
-        return self._id_all
+        return self._master.frame
+    
+    @property
+    def master(self) :
+        return self._master
+    
+    @property
+    def graph(self) :
+        return self._graph
+    
+    @property
+    def spot(self) :
+        return self._spot
+    
+    @property
+    def version(self) :
+        """
+        (pricing_dt, generation of the last input set on the date)
+        """
+        return (self._pricing_dt, self._inputs)
     
     @property
     def pricing_dt(self) :
@@ -141,9 +431,7 @@ class Securities:
     @pricing_dt.setter
     def pricing_dt(self, new_dt:date) :
         self._pricing_dt = new_dt
-        self.last_prices()
-        self._curves.pricing_dt = new_dt
-        self._volatilities.pricing_dt = new_dt
+        self._inputs = self.inputs(new_dt)
         self.update()        
     
         
@@ -2,6 +2,7 @@
 # -*- coding: utf-8 -*-
 
 import io
+import hashlib
 import pandas as pd
 import numpy as np
 import requests
@@ -10,12 +11,19 @@ from datetime import datetime as dt
 from datetime import timedelta as td
 from datetime import date
 
+from .schedule import get_schedule, add_months
+from .interpolator import LinearInterpolator
+
 FOLDER = __file__[:-len('curves.py')]
+BOOTSTRAP_version = '2'
+ZERO_e = 1e-10 # diff in price
+ZERO_max_it = 50
+ZERO_max = 100 # upper bracket of zero rates (in %)
 
 class Curves :
     
     def __init__(self, country:str, initial_pricing_dt:date,
-                 hist_start_dt:date, download:bool=True) :
+                 hist_start_dt:date, download:bool=True, history:bool=False) :
         """
         Generates Curves
         :Parameters:
@@ -23,6 +31,9 @@ class Curves :
                 Country
             pricing_dt : date,
                 Initial Pricing Date
+            history : bool,
+                Bootstraps the whole history once (cached on disk) and
+                looks the zero curve up on pricing_dt changes
         """
         
         self._country = country
@@ -37,6 +48,9 @@ class Curves :
         self.downloadGovt(download)
         self.updateGovt()
         
+        self._history = history
+        if history :
+            self.bootstrapHistory()
         self.updateZero()
         
     def downloadDeposits(self, download:bool=True) :
@@ -126,70 +140,184 @@ class Curves :
          
     def updateZero(self) :
         
-        _zero = self._deposits.copy()
-        _zero.columns = ['rate']
-        _zero['df'] = 1 / ( 1 + _zero['rate'] * _zero.index / 36000 )
+        if self._history :
+            idx = self._zeroHistory['dates'].get_indexer([self._pricing_dt], method='nearest')[0]
+            _zero = pd.DataFrame({'rate' : self._zeroHistory['rate'][idx],
+                                  'df' : self._zeroHistory['df'][idx],
+                                  'converged' : self._zeroHistory['converged'][idx]},
+                                 index=self._zeroHistory['days'])
+        else :
+            _zero = self.bootstrap(self._deposits, self._govt, self._pricing_dt)
+        
+        self._converged = bool(_zero.pop('converged').all())
+        if not self._converged :
+            warnings.warn(f'Zero curve bootstrap did not converge for {self._pricing_dt}')
+        
+        #Adjustment on the index (maybe not necessary in the future)
+        _zero['dates'] = _zero.index.map(lambda x : self._pricing_dt + td(days=int(x)))
+        _zero.set_index('dates', inplace=True)
+        self._zero = _zero
+        self._interpolator = CurveInterpolator.fromFrame(_zero, self._pricing_dt)
+    
+    @staticmethod
+    def bootstrap(deposits:pd.DataFrame, govt:pd.DataFrame, pricing_dt:date) -> pd.DataFrame :
+        """
+        Bootstraps the zero curve (rate, df and converged flag indexed by days)
+        of a single date from deposits and government par yields
+        """
+        govt = govt.loc[govt.index > deposits.index[-1]]
+        _zero = Curves.bootstrapArrays(deposits.index.values.astype(int),
+                                       deposits.iloc[:, 0].values.astype(float)[None, :],
+                                       govt.index.values.astype(int),
+                                       govt.iloc[:, 0].values.astype(float)[None, :],
+                                       [pricing_dt])
+        
+        return pd.DataFrame({'rate' : _zero['rate'][0],
+                             'df' : _zero['df'][0],
+                             'converged' : _zero['converged'][0]},
+                            index=_zero['days'])
+    
+    @staticmethod
+    def bootstrapArrays(dep_days:np.ndarray, dep_rates:np.ndarray,
+                        govt_days:np.ndarray, govt_rates:np.ndarray,
+                        pricing_dts:list[date]) -> dict :
+        """
+        Bootstraps zero curves for many dates at once
+        :parameters:
+            dep_days : np.ndarray (tenors),
+                Days of the deposits
+            dep_rates : np.ndarray (dates x tenors),
+                Deposit rates (act/360, in %)
+            govt_days : np.ndarray (tenors),
+                Days of the government bonds (beyond the last deposit)
+            govt_rates : np.ndarray (dates x tenors),
+                Government par yields (semi-annual coupons, in %)
+            pricing_dts : list, date,
+                Curve dates
+        :returns:
+            dict with days (tenors), rate, df and converged (dates x tenors)
+        """
+        
+        ## *** SAFEGUARDED NEWTON RAPHSON PER TENOR (all dates at once) ****
+        # f(z) = sum_known ( flow . df ) + sum_new ( flow / (1 + z . days / 36500) ) - origin_pv
+        # f'(z) = - sum_new ( flow . days / 36500 / (1 + z . days / 36500)^2 )
+        # z1 = zo - fz / f'z, falling back to bisection outside the bracket
+        ## *****************************************************************
+        
+        _pricing_dts = np.array(pricing_dts, dtype='datetime64[D]')
+        n = _pricing_dts.shape[0]
+        days = np.concatenate([[0], dep_days])
+        rate = np.concatenate([np.zeros((n, 1)), dep_rates], axis=1)
+        df = 1 / ( 1 + rate * days / 36000 )
+        converged = np.ones(rate.shape, dtype=bool)
         
-        next_ust = self._govt.loc[self._govt.index > _zero.index[-1]]
-        max_j = 20
-        j = 0
-        while (not next_ust.empty) & (j <= max_j) :
+        for j, tenor in enumerate(govt_days) :
+            coupon = govt_rates[:, j]
+            maturity = _pricing_dts + int(tenor)
+            steps = np.arange(int(tenor) // 180 + 2) * 6
+            dates = add_months(np.repeat(maturity[:, None], steps.shape[0], axis=1), -steps[None, :])
+            mask = dates > _pricing_dts[:, None]
+            flow_days = np.where(mask, (dates - _pricing_dts[:, None]).astype(int), 0)
+            flow = np.where(mask, coupon[:, None] / 2, 0.)
+            flow[:, 0] += 100
             
-            _maturity = self._pricing_dt + td(days=int(next_ust.index[0]))
-            _coupon = next_ust.iloc[0, 0]
-            ust = self.cash_flow(_maturity, _coupon, pricing_dt=self._pricing_dt)
-            ust['zero_df'] = (ust.join(_zero, how='outer')
-                             .astype(float)
-                             .sort_index()
-                             .interpolate('index')
-                             .loc[ust.index, 'df'])                 
+            origin_pv = (flow / ( (1 + coupon[:, None] / 200) ** (flow_days / 180) )).sum(axis=1)
             
-            y = _coupon
-            ust['origin_pv'] = ust.apply(lambda x : x['flow'] / ( (1 + y / 200) ** (x.name/180) ), axis = 1)
-            ust['bootstrap_pv'] = ust['flow'] * ust['zero_df']                
-                
-            e = 0.001
-            max_it = 20
-            diff = 0.02
+            known = flow_days <= days[-1]
+            idx = np.clip(np.searchsorted(days, flow_days, side='right'), 1, days.shape[0] - 1)
+            d0, d1 = days[idx - 1], days[idx]
+            df0 = np.take_along_axis(df, idx - 1, axis=1)
+            df1 = np.take_along_axis(df, idx, axis=1)
+            known_pv = (np.where(known, flow * (df0 + (flow_days - d0) / (d1 - d0) * (df1 - df0)), 0.)).sum(axis=1)
+            
+            a = np.where(known, 0, flow_days) / 36500
+            new_flow = np.where(known, 0., flow)
+            lo = np.full(n, -0.5 / a.max(initial=1e-9))
+            hi = np.full(n, ZERO_max)
+            z = coupon.copy()
+            fz = np.full(n, np.inf)
             i = 0
-            zero_y = _coupon
-
-            while (diff > e) & (i <= max_it) :
-                if (ust['origin_pv'].sum() - ust['bootstrap_pv'].sum()) > 0 :
-                    zero_y -= 0.01
-                else : 
-                    zero_y -= 0.01
-                
-                ust.loc[ust.index>_zero.index[-1], 'zero_df'] = ust.loc[ust.index>_zero.index[-1]].index.map(lambda x:  1 / ( 1 + zero_y * x / 36500 ))
-                ust.loc[:, 'bootstrap_pv'] = ust['flow'] * ust['zero_df']
-                diff = abs(ust['origin_pv'].sum() - ust['bootstrap_pv'].sum())
-                i += 1 
+            active = ~np.isnan(coupon)
             
-            _zero.loc[ust.index[-1], 'rate'] = zero_y
-            _zero.loc[ust.index[-1], 'df'] = 1 / ( 1 + zero_y * ust.index[-1] / 36500 )
+            while active.any() and (i <= ZERO_max_it) :
+                base = 1 + z[:, None] * a
+                fz = known_pv + (new_flow / base).sum(axis=1) - origin_pv
+                dfz = (-new_flow * a / base ** 2).sum(axis=1)
                 
-            next_ust = self._govt.loc[self._govt.index > _zero.index[-1]]
-            j += 1
+                lo = np.where(fz > 0, z, lo)
+                hi = np.where(fz < 0, z, hi)
+                step = z - fz / dfz
+                bisect = ~((step > lo) & (step < hi))
+                z = np.where(active, np.where(bisect, (lo + hi) / 2, step), z)
+                
+                active &= np.abs(fz) >= ZERO_e
+                i += 1
+            
+            rate = np.concatenate([rate, z[:, None]], axis=1)
+            df = np.concatenate([df, (1 / ( 1 + z * tenor / 36500 ))[:, None]], axis=1)
+            converged = np.concatenate([converged, (np.abs(fz) < ZERO_e)[:, None]], axis=1)
+            days = np.concatenate([days, [tenor]])
         
+        return {'days' : days[1:],
+                'rate' : rate[:, 1:],
+                'df' : df[:, 1:],
+                'converged' : converged[:, 1:]}
+    
+    def bootstrapHistory(self) :
+        """
+        Bootstraps the zero curve of every date in the govt history in one pass
+        and keeps it as a (dates x tenors) array, saved on disk and reloaded
+        while the input histories are unchanged
+        """
+        key = self._historyKey()
+        file = FOLDER + '_data/' + self._country + '_zero_history.npz'
+        try :
+            with np.load(file) as cache :
+                if str(cache['key']) == key :
+                    self._zeroHistory = {
+                        'dates' : pd.Index([x.item() for x in cache['dates']]),
+                        'days' : cache['days'],
+                        'rate' : cache['rate'],
+                        'df' : cache['df'],
+                        'converged' : cache['converged']
+                    }
+                    return
+        except (OSError, KeyError, ValueError) :
+            pass
         
-        #Adjustment on the index (maybe not necessary in the future)
-        _zero['dates'] = _zero.index.map(lambda x : self._pricing_dt + td(days=int(x)))
-        _zero.set_index('dates', inplace=True)
-        self._zero = _zero
+        govtHistory = self._govtHistory[self._country]
+        depositsHistory = self._depositsHistory[self._country]
+        idx = depositsHistory.index.get_indexer(govtHistory.index, method='nearest')
+        deposits = depositsHistory.iloc[idx].loc[:, ['30', '90', '180']]
+        govt = govtHistory.loc[:, govtHistory.columns.map(int) > 180]
+        
+        self._zeroHistory = self.bootstrapArrays(deposits.columns.map(int).values,
+                                                 deposits.values.astype(float),
+                                                 govt.columns.map(int).values,
+                                                 govt.values.astype(float),
+                                                 govtHistory.index.tolist())
+        self._zeroHistory['dates'] = pd.Index(govtHistory.index)
+        np.savez(file, key=key,
+                 dates=np.array(govtHistory.index, dtype='datetime64[D]'),
+                 days=self._zeroHistory['days'],
+                 rate=self._zeroHistory['rate'],
+                 df=self._zeroHistory['df'],
+                 converged=self._zeroHistory['converged'])
     
-    def interpolate(self, _date:date) -> float:
-        _table = self._zero[['df']].copy()
-        _table.loc[_date, 'df'] = np.NaN
-        _table.index = pd.DatetimeIndex(_table.index)
-        _table = (_table.sort_index()
-                  .astype(float)
-                  .interpolate('time',
-                               fill_value='extrapolate',
-                               limit_direction='both',
-                               axis=0))
-        _table.index = _table.index.map(lambda x : x.date())
+    def _historyKey(self) -> str :
+        # Any change in the input histories (or in the bootstrap) invalidates the cache
+        h = hashlib.sha1(BOOTSTRAP_version.encode())
+        for history in [self._depositsHistory[self._country], self._govtHistory[self._country]] :
+            h.update(pd.util.hash_pandas_object(history.reset_index()).values.tobytes())
         
-        return _table.loc[_date, 'df']
+        return h.hexdigest()
+    
+    def interpolate(self, _date) :
+        """
+        Discount factor for a date (or an array of dates, in one batch)
+        """
+        days = (np.array(_date, dtype='datetime64[D]') - np.datetime64(self._pricing_dt, 'D')).astype(int)
+        return self._interpolator.df(days)
     
     @property
     def deposits(self) :
@@ -203,6 +331,14 @@ class Curves :
     def zero(self) :
         return self._zero
     
+    @property
+    def converged(self) :
+        return self._converged
+    
+    @property
+    def interpolator(self) :
+        return self._interpolator
+    
     @property
     def pricing_dt(self) :
         return self._pricing_dt
@@ -216,46 +352,57 @@ class Curves :
     @staticmethod
     def cash_flow(maturity:date, coupon:float, pricing_dt:date=dt.now().date(),
                    freq:int=6) -> pd.DataFrame:
-        _cshf = {
-            'dates': [maturity],
-            'flow': [100 + coupon / (12 / freq)]
-        }
-        new_year = maturity.year + ((maturity.month - freq) < 0) * - 1
-        new_month = (maturity.month - freq) % 12
-        if new_month == 0 :
-            new_month = 12
-        try :
-            _date = date(new_year, new_month, maturity.day) # if 31 works
-        except :
-            try :
-                _date = date(new_year, new_month, maturity.day-1) # 30 works
-            except :
-                try :
-                    _date = date(new_year, new_month, maturity.day-2) # 29 works
-                except :
-                    _date = date(new_year, new_month, maturity.day-3) # 28 works
-
-        while _date > pricing_dt:
-            _cshf['dates'].append(_date)
-            _cshf['flow'].append(coupon / (12 / freq))
-            new_year = _date.year + ((_date.month - freq) <= 0) * - 1
-            new_month = (_date.month - freq) % 12
-            if new_month == 0 :
-                new_month = 12
-            try :
-                _date = date(new_year, new_month, maturity.day) # if 31 works
-            except :
-                try :
-                    _date = date(new_year, new_month, maturity.day-1) # 30 works
-                except :
-                    try :
-                        _date = date(new_year, new_month, maturity.day-2) # 29 works
-                    except :
-                        _date = date(new_year, new_month, maturity.day-3) # 28 works
-
-        cshf = pd.DataFrame(_cshf).set_index('dates').sort_index()
-        cshf['days'] = (cshf.index - pricing_dt).days
-        cshf = cshf.set_index('days').sort_index()
+        _, flow, days, _ = get_schedule(maturity, coupon, freq).slice(pricing_dt)
+        cshf = pd.DataFrame({'flow' : flow}, index=pd.Index(days, name='days'))
         
         return cshf
-        
\ No newline at end of file
+
+
+class CurveInterpolator :
+    
+    def __init__(self, days:np.ndarray, df:np.ndarray) :
+        """
+        Discount curve compiled into sorted arrays, built once per curve date
+        :parameters:
+            days : np.ndarray,
+                Days from the curve date of each pillar
+            df : np.ndarray,
+                Discount factor of each pillar
+        :methods:
+            df : discount factors for an array of days (linear, flat outside)
+            zero_y : simple act/360 zero yields for an array of days
+            
+            days, dfs : pillars of the curve
+            
+            equals : same pillars as another curve
+        """
+        self._linear = LinearInterpolator(days, df, extrapolate='flat')
+    
+    @classmethod
+    def fromFrame(cls, zero:pd.DataFrame, pricing_dt:date) :
+        """
+        Build from a zero curve DataFrame indexed by dates with a df column
+        """
+        days = (np.array(zero.index, dtype='datetime64[D]') - np.datetime64(pricing_dt, 'D')).astype(int)
+        return cls(days, zero['df'].values)
+    
+    def df(self, days:np.ndarray) -> np.ndarray :
+        return self._linear(days)
+    
+    def zero_y(self, days:np.ndarray) -> np.ndarray :
+        return (1 / self.df(days) - 1) * 360 / days
+    
+    def equals(self, other) -> bool :
+        """
+        Same pillars and discount factors (curves rebuilt for the same date)
+        """
+        return (isinstance(other, CurveInterpolator)
+                and np.array_equal(self.days, other.days) and np.array_equal(self.dfs, other.dfs))
+    
+    @property
+    def days(self) :
+        return self._linear.x
+    
+    @property
+    def dfs(self) :
+        return self._linear.y
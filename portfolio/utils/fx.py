@@ -0,0 +1,102 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import pandas as pd
+import numpy as np
+from datetime import date
+
+FX_base = 'USD'
+FX_currencies = {'USD' : 'USD', 'EUR' : 'EUR=X', 'CHF' : 'CHF=X',
+                 'CAD' : 'CAD=X', 'BRL' : 'BRL=X', 'GBP' : 'GBP=X'} # currency : price history code
+
+class FxEngine :
+
+    def __init__(self, store, currencies:dict=FX_currencies, asof:str='nearest') :
+        """
+        USD rates (Currency per USD, as ccy_price) of a set of currencies,
+        current and historical, with cross rates and conversions of whole
+        arrays of amounts
+        :parameters:
+            store : PriceStore,
+                Price history with the rates of the currencies
+            currencies : dict,
+                Currency : code of its USD rate in the history (a currency
+                without history, as the base, has a rate of 1)
+            asof : str,
+                As of semantics of the history (see PriceStore)
+
+        :methods:
+            rates : USD rates of currencies, current or on dates
+
+            matrix : (dates x currencies) USD rates
+
+            cross : units of quote per unit of base
+
+            convert : amounts from their currencies into another one
+        """
+        self._store = store
+        self._asof = asof
+        self._currencies = pd.Index(list(currencies), name='currency')
+        self._codes = pd.Index(list(currencies.values()))
+        self._rates = np.ones(self._currencies.shape[0])
+
+    def _table(self, dates:list[date]) -> np.ndarray :
+        return self._store.matrix(dates, self._codes, self._asof, 1.)
+
+    def _gather(self, table:np.ndarray, rows:np.ndarray, currencies) -> np.ndarray :
+        pos = self._currencies.get_indexer(currencies)
+        return np.where(pos >= 0, table[rows, np.maximum(pos, 0)], np.nan)
+
+    def setRates(self, rates:np.ndarray) :
+        """
+        Current rates (same order as currencies), 1 until set
+        """
+        self._rates = np.asarray(rates, dtype=float).copy()
+
+    def rates(self, currencies:list[str], dates:list[date]=None) -> np.ndarray :
+        """
+        Current (currencies) or (dates x currencies) USD rates, NaN for
+        currencies out of the engine
+        """
+        if dates is None :
+            return self._gather(self._rates[None, :], 0, currencies)
+        table = self._table(dates)
+        return self._gather(table, np.arange(table.shape[0])[:, None], currencies)
+
+    def matrix(self, dates:list[date]) -> pd.DataFrame :
+        return pd.DataFrame(self._table(dates), index=pd.Index(dates, name='dates'), columns=self._currencies)
+
+    def cross(self, base:str, quote:str, dates:list[date]=None) :
+        """
+        Units of quote per unit of base, current or on dates
+        """
+        rates = self.rates([base, quote], dates)
+        return rates[..., 1] / rates[..., 0]
+
+    def convert(self, amounts:np.ndarray, currencies:list[str], to:str=FX_base, dates=None) -> np.ndarray :
+        """
+        Amounts in currencies converted into to, at the current rates
+        (dates None), the rates of one date or of a date per amount
+        """
+        amounts = np.asarray(amounts, dtype=float)
+        if dates is None or np.ndim(dates) == 0 :
+            table = self._rates[None, :] if dates is None else self._table([dates])
+            rows = np.zeros(amounts.shape[0], dtype=int)
+        else :
+            rows, uniques = pd.factorize(pd.Index(dates))
+            table = self._table(list(uniques))
+
+        return (amounts / self._gather(table, rows, currencies)
+                * self._gather(table, rows, np.full(amounts.shape[0], to, dtype=object)))
+
+    @property
+    def currencies(self) :
+        return self._currencies
+
+    @property
+    def codes(self) :
+        return self._codes
+
+    @property
+    def current(self) -> pd.Series :
+        return pd.Series(self._rates, index=self._currencies)
@@ -0,0 +1,72 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+class DependencyGraph :
+
+    def __init__(self) :
+        """
+        Calculation nodes with dirty flags. Marking a node dirty marks every
+        node that depends on it, and refresh only recomputes the dirty ones
+        (in the order they were added, so dependencies go first)
+        :methods:
+            addNode : registers a node, its calculation and its dependencies
+
+            invalidate : marks nodes (and their dependents) dirty
+
+            touch : marks only the dependents of nodes dirty (the node
+                itself was set from outside)
+
+            refresh : recomputes the dirty nodes
+        """
+        self._compute = {}
+        self._children = {}
+        self._dirty = set()
+        self._last = []
+
+    def addNode(self, name:str, compute, depends:list[str]=None) :
+        for parent in ([] if depends is None else depends) :
+            if parent not in self._compute :
+                raise KeyError(f'Unknown dependency {parent} for node {name}')
+            self._children[parent].append(name)
+        self._compute[name] = compute
+        self._children[name] = []
+
+    def _downstream(self, names) -> set :
+        nodes = set()
+        stack = list(names)
+        while stack :
+            for child in self._children[stack.pop()] :
+                if child not in nodes :
+                    nodes.add(child)
+                    stack.append(child)
+
+        return nodes
+
+    def invalidate(self, *names:str) :
+        self._dirty |= set(names) | self._downstream(names)
+
+    def touch(self, *names:str) :
+        self._dirty |= self._downstream(names)
+
+    def refresh(self) -> list[str] :
+        """
+        Recomputes the dirty nodes and returns their names
+        """
+        self._last = [name for name in self._compute if name in self._dirty]
+        for name in self._last :
+            self._compute[name]()
+            self._dirty.discard(name)
+
+        return self._last
+
+    @property
+    def dirty(self) :
+        return set(self._dirty)
+
+    @property
+    def last(self) :
+        return list(self._last)
+
+    @property
+    def nodes(self) :
+        return list(self._compute)
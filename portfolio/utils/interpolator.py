@@ -0,0 +1,110 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import pandas as pd
+import numpy as np
+
+class LinearInterpolator :
+
+    def __init__(self, x:np.ndarray, y:np.ndarray, extrapolate:str='flat') :
+        """
+        1D linear interpolator built once, answering batch queries
+        :parameters:
+            x : np.ndarray,
+                Nodes (numbers or dates)
+            y : np.ndarray,
+                Values on the nodes (NaN values are dropped)
+            extrapolate : str,
+                'flat' or 'linear' outside the nodes
+        """
+        x = _to_float(x)
+        y = np.asarray(y, dtype=float)
+        valid = ~np.isnan(y)
+        order = np.argsort(x[valid])
+        self._x = x[valid][order]
+        self._y = y[valid][order]
+        self._extrapolate = extrapolate
+
+    def __call__(self, q) -> np.ndarray :
+        if self._x.shape[0] == 0 :
+            return np.full(np.shape(q), np.nan)
+        i0, i1, w = _locate(self._x, _to_float(q), self._extrapolate)
+        return self._y[i0] + (self._y[i1] - self._y[i0]) * w
+
+    @property
+    def x(self) :
+        return self._x
+
+    @property
+    def y(self) :
+        return self._y
+
+class GridInterpolator :
+
+    def __init__(self, rows:np.ndarray, cols:np.ndarray, values:np.ndarray,
+                 extrapolate:str='linear') :
+        """
+        Bilinear interpolator over a (rows x cols) grid, built once and
+        answering batch queries (e.g. tenor x moneyness of a vol surface)
+        NaN cells are filled once at build time along the rows and then
+        along the columns
+        :parameters:
+            rows : np.ndarray,
+                Row nodes
+            cols : np.ndarray,
+                Column nodes
+            values : np.ndarray,
+                (rows x cols) values
+            extrapolate : str,
+                'flat' or 'linear' outside the grid
+        """
+        rows = _to_float(rows)
+        cols = _to_float(cols)
+        r_order = np.argsort(rows)
+        c_order = np.argsort(cols)
+        self._rows = rows[r_order]
+        self._cols = cols[c_order]
+        self._extrapolate = extrapolate
+
+        values = np.array(values, dtype=float)[r_order][:, c_order]
+        for j in range(values.shape[1]) :
+            values[:, j] = LinearInterpolator(self._rows, values[:, j], extrapolate)(self._rows)
+        for i in range(values.shape[0]) :
+            values[i, :] = LinearInterpolator(self._cols, values[i, :], extrapolate)(self._cols)
+        self._values = values
+
+    @classmethod
+    def fromFrame(cls, table:pd.DataFrame, extrapolate:str='linear') :
+        return cls(table.index.values, table.columns.values, table.values, extrapolate)
+
+    def __call__(self, r, c) -> np.ndarray :
+        r, c = np.broadcast_arrays(_to_float(r), _to_float(c))
+        r0, r1, wr = _locate(self._rows, r, self._extrapolate)
+        c0, c1, wc = _locate(self._cols, c, self._extrapolate)
+        v = self._values
+
+        return ((1 - wr) * (1 - wc) * v[r0, c0] + (1 - wr) * wc * v[r0, c1]
+                + wr * (1 - wc) * v[r1, c0] + wr * wc * v[r1, c1])
+
+    @property
+    def values(self) :
+        return self._values
+
+def _to_float(x) -> np.ndarray :
+    x = np.asarray(x)
+    if x.dtype.kind in 'OMm' :
+        x = np.array(x, dtype='datetime64[D]').astype(int)
+    return x.astype(float)
+
+def _locate(nodes:np.ndarray, q:np.ndarray, extrapolate:str) -> tuple :
+    # Left / right node and weight of each query
+    if nodes.shape[0] == 1 :
+        zero = np.zeros(np.shape(q), dtype=int)
+        return zero, zero, np.zeros(np.shape(q))
+    i1 = np.clip(np.searchsorted(nodes, q, side='right'), 1, nodes.shape[0] - 1)
+    i0 = i1 - 1
+    w = (q - nodes[i0]) / (nodes[i1] - nodes[i0])
+    if extrapolate == 'flat' :
+        w = np.clip(w, 0, 1)
+
+    return i0, i1, w
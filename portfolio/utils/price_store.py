@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import pandas as pd
+import numpy as np
+from datetime import date
+
+PRICE_asof = ['nearest', 'last', 'prior']
+
+class PriceStore :
+
+    def __init__(self, hist:pd.DataFrame) :
+        """
+        Price history kept as a (dates x instruments) float matrix with an
+        id map and a row lookup table per calendar day, so the prices of a
+        date are one row read and any set of ids is one gather
+        :parameters:
+            hist : pd.DataFrame,
+                Prices indexed by date with one column per instrument
+
+        As of semantics (how) :
+            nearest : nearest date of the history (as recorded)
+            last : last value of each instrument on or before the date
+            prior : last value of each instrument strictly before the date
+
+        :methods:
+            prices : prices of a date (all instruments or some ids)
+
+            matrix : (dates x ids) prices
+        """
+        hist = hist.sort_index()
+        self._dates = np.array(list(hist.index), dtype='datetime64[D]')
+        self._ids = pd.Index(hist.columns)
+        self._values = {'nearest' : hist.values.astype(float)}
+        self._values['last'] = self._values['prior'] = hist.ffill().values.astype(float)
+
+        days = np.arange(self._dates[0], self._dates[-1] + 1)
+        last = np.searchsorted(self._dates, days, side='right') - 1
+        after = np.searchsorted(self._dates, days, side='left')
+        # Ties go to the later date, as pd.Index.get_indexer(method='nearest')
+        nearest = np.where(self._dates[after] - days <= days - self._dates[last], after, last)
+        self._rows = {'nearest' : nearest, 'last' : last, 'prior' : after - 1}
+
+    def rows(self, dates:list[date], how:str='nearest') -> np.ndarray :
+        """
+        Rows of the history for each date (-1 before the history)
+        """
+        offset = (np.array(dates, dtype='datetime64[D]') - self._dates[0]).astype(int)
+        rows = self._rows[how][np.clip(offset, 0, self._rows[how].shape[0] - 1)]
+        rows = np.where(offset >= self._rows[how].shape[0], self._dates.shape[0] - 1, rows)
+
+        return np.where(offset < 0, 0 if how == 'nearest' else -1, rows)
+
+    def columns(self, ids:list) -> np.ndarray :
+        """
+        Columns of the ids (-1 for ids without history)
+        """
+        return self._ids.get_indexer(ids)
+
+    def prices(self, _date:date, ids:list=None, how:str='nearest', default=np.nan) -> np.ndarray :
+        """
+        Prices of the date for all the instruments (ids None) or for ids,
+        default (scalar or per id) for ids without history
+        """
+        if ids is None :
+            row = self.rows([_date], how)[0]
+            return self._values[how][row].copy() if row >= 0 else np.full(self._ids.shape[0], np.nan)
+
+        return self.matrix([_date], ids, how, default)[0]
+
+    def matrix(self, dates:list[date], ids:list, how:str='nearest', default=np.nan) -> np.ndarray :
+        """
+        (dates x ids) prices, default (scalar or per id) for ids without history
+        """
+        rows = self.rows(dates, how)
+        cols = self.columns(ids)
+        values = self._values[how][np.maximum(rows, 0)][:, np.maximum(cols, 0)]
+        values[rows < 0] = np.nan
+
+        return np.where(cols >= 0, values, default)
+
+    @property
+    def ids(self) :
+        return self._ids
+
+    @property
+    def dates(self) :
+        return self._dates
+
+    @property
+    def values(self) :
+        return self._values['nearest']
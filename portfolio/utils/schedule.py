@@ -0,0 +1,114 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import numpy as np
+from datetime import date
+
+SCHEDULE_periods = 20 # coupon periods generated on the first request
+
+_SCHEDULES = {}
+
+class Schedule :
+
+    def __init__(self, maturity:date, coupon:float, freq:int=6) :
+        """
+        Coupon schedule of a bullet bond, generated once as date / flow arrays
+        and rolled forward by slicing
+        :parameters:
+            maturity : date,
+                Maturity
+
+            coupon : float,
+                Coupon
+
+            freq : int,
+                Frequency (in months)
+
+        :methods:
+            cover : extends the schedule back to a pricing date if needed
+
+            slice : future dates, flows and days for a pricing date
+        """
+        self._maturity = np.datetime64(maturity, 'D')
+        self._coupon = coupon
+        self._freq = freq
+        self._n = 12 / freq
+        self._generate(SCHEDULE_periods)
+
+    def _generate(self, periods:int) :
+        # Coupon dates go back from maturity in steps of freq months,
+        # keeping the maturity day (or the last day of shorter months)
+        steps = np.arange(periods)[::-1] * self._freq
+        self._dates = add_months(np.full(periods, self._maturity), -steps)
+        self._flow = np.full(periods, self._coupon / self._n)
+        self._flow[-1] += 100
+
+    def cover(self, pricing_dt:date) :
+        """
+        Makes sure there is a coupon date on or before pricing_dt
+        (start of the accrual period)
+        """
+        _pricing_dt = np.datetime64(pricing_dt, 'D')
+        periods = self._dates.shape[0]
+        while self._dates[0] > _pricing_dt :
+            periods *= 2
+            self._generate(periods)
+
+    def slice(self, pricing_dt:date) -> tuple :
+        """
+        Returns the future dates, flows and days (from pricing_dt)
+        and the last coupon date before pricing_dt
+        """
+        self.cover(pricing_dt)
+        _pricing_dt = np.datetime64(pricing_dt, 'D')
+        idx = np.searchsorted(self._dates, _pricing_dt, side='right')
+        dates = self._dates[idx:]
+        days = (dates - _pricing_dt).astype(int)
+
+        return dates, self._flow[idx:], days, self._dates[idx-1]
+
+    @property
+    def dates(self) :
+        return self._dates
+
+    @property
+    def flow(self) :
+        return self._flow
+
+def get_schedule(maturity:date, coupon:float, freq:int=6) -> Schedule :
+    """
+    Cached Schedule for (maturity, coupon, freq)
+    """
+    key = (np.datetime64(maturity, 'D'), float(coupon), freq)
+    if key not in _SCHEDULES :
+        _SCHEDULES[key] = Schedule(maturity, coupon, freq)
+
+    return _SCHEDULES[key]
+
+def stack(schedules:list[Schedule], pricing_dt:date) -> tuple :
+    """
+    Right aligned (schedules x dates) arrays of dates and flows covering
+    pricing_dt, padded with NaT / 0 on the left
+    """
+    for s in schedules :
+        s.cover(pricing_dt)
+    m = max([s.dates.shape[0] for s in schedules], default=0)
+    dates = np.full((len(schedules), m), np.datetime64('NaT'), dtype='datetime64[D]')
+    flow = np.zeros((len(schedules), m))
+    for i, s in enumerate(schedules) :
+        dates[i, m - s.dates.shape[0]:] = s.dates
+        flow[i, m - s.flow.shape[0]:] = s.flow
+
+    return dates, flow
+
+def add_months(dates:np.ndarray, months:np.ndarray) -> np.ndarray :
+    """
+    Adds months to datetime64[D] dates, keeping the day of the month
+    (or the last day of shorter months)
+    """
+    _months = dates.astype('datetime64[M]')
+    day = (dates - _months.astype('datetime64[D]')).astype(int)
+    new_months = _months + months
+    month_len = ((new_months + 1).astype('datetime64[D]') - new_months.astype('datetime64[D]')).astype(int)
+
+    return new_months.astype('datetime64[D]') + np.minimum(day, month_len - 1)
@@ -3,6 +3,8 @@ import numpy as np
 
 from IPython.display import display_html
 from itertools import chain,cycle
+
+from .interpolator import GridInterpolator
     
 def display_side_by_side(*args):
     html_str=''
@@ -23,8 +25,4 @@ def display_side_by_side_title(*args, titles=cycle([''])):
     display_html(html_str, raw=True)
     
 def interpolate(coord:tuple, table:pd.DataFrame) -> float :
-    _table = table.copy()
-    _table.loc[coord[0], coord[1]] = np.NaN
-    _table = _table[sorted(_table.columns)].sort_index().interpolate('slinear', fill_value='extrapolate', limit_direction='both',axis=0).interpolate(axis=1)
-    
-    return _table.loc[coord[0], coord[1]]
\ No newline at end of file
+    return float(GridInterpolator.fromFrame(table)(coord[0], coord[1]))
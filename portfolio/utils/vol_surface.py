@@ -1,3 +1,4 @@
+import hashlib
 import yfinance as yf
 import pandas as pd
 import numpy as np
@@ -7,9 +8,11 @@ from datetime import date
 
 import matplotlib.pyplot as plt
 
-from ..options import SPYOption
+from ..options import SPYOption, OptionBook, SPY_r
+from .interpolator import GridInterpolator
 
 FOLDER = __file__[:-len('vol_surface.py')]
+CUBE_version = '2' # bump when the solver of the cube changes
 
 class Vol_surface :
         
@@ -74,20 +77,18 @@ class Vol_surface :
         ax.set_zlabel('Volatility', fontsize=12, fontweight='bold')
         plt.show()
 
-    def interpolate(self, _t:float, _money:float) -> float :
-        _table = self._surface.copy()
-        _table.loc[_t, _money] = np.NaN
-        _table = (_table[sorted(_table.columns)]
-                  .sort_index()
-                  .interpolate('slinear',
-                               fill_value='extrapolate',
-                               limit_direction='both',
-                               axis=0)
-                  .interpolate('slinear',
-                               fill_value='extrapolate',
-                               limit_direction='both',
-                               axis=1))
-        return _table.loc[_t, _money]
+    def interpolate(self, _t, _money) :
+        """
+        Vol for a tenor and moneyness (or arrays of them, in one batch)
+        """
+        return self.interpolator(_t, _money)
+    
+    @property
+    def interpolator(self) :
+        # Built once per surface, createSurface resets it
+        if getattr(self, '_interpolator', None) is None :
+            self._interpolator = GridInterpolator.fromFrame(self._surface)
+        return self._interpolator
     
     @property
     def surface(self):
@@ -103,11 +104,22 @@ class Vol_surface :
         
 class SPYVolSurface(Vol_surface) :
     
-    def __init__(self, initial_pricing_dt:date, r:float, i:float, download:bool=True) :
+    def __init__(self, initial_pricing_dt:date, r:float, i:float, download:bool=True,
+                 history:bool=False) :
+        """
+        SPY volatility surface (tenor x moneyness)
+        :parameters:
+            history : bool,
+                Solves the surface of every date once (cached on disk) and
+                looks it up on pricing_dt changes
+        """
         self._pricing_dt = initial_pricing_dt
         self._r = r
         self._i = i
+        self._history = history
         self.downloadHistory(download)
+        if history :
+            self.buildCube()
         self.createSurface()
         
     def downloadHistory(self, download:bool=True) :
@@ -147,18 +159,89 @@ class SPYVolSurface(Vol_surface) :
         
     def createSurface(self) :
         
+        self._interpolator = None
+        if self._history :
+            idx = self._cubeDates.get_indexer([self._pricing_dt], method='nearest')[0]
+            self._surface = pd.DataFrame(self._cube[idx],
+                                         index=pd.Index(self._cubeTenors[idx], name='tenor'),
+                                         columns=pd.Index(self._cubeMoneyness[idx], name='moneyness'),
+                                         copy=False)
+            return
+        
         idx = self._opt_prices.index.get_indexer([self._pricing_dt], method='nearest')
-        opt_prices = self._opt_prices.iloc[idx].T.iloc[:, 0]
-        idx = self._spots.index.get_indexer([self._pricing_dt], method='nearest')[0]
-        spot = self._spots.iloc[idx][0]
-        spy_opt = []
-            
-        for code in opt_prices.index :
-            opt = SPYOption(code, self._pricing_dt, price=opt_prices[code], spot=spot)
-            spy_opt.append(opt)
-    
-        table = pd.DataFrame([{'moneyness': (x._K / spot - 1), 'tenor' : round(x._t, 2), 'vol' : x.vol} for x in spy_opt])
-
-        table = table.pivot_table(values='vol', index='tenor', columns='moneyness', aggfunc='sum')
+        opt_prices = self._opt_prices.iloc[idx]
+        idx = self._spots.index.get_indexer([self._pricing_dt], method='nearest')
+        spots = self._spots.iloc[idx, 0].values
+        vols, tenors, moneyness = self._surfaceArrays([self._pricing_dt], opt_prices, spots)
+        
+        self._surface = pd.DataFrame(vols[0],
+                                     index=pd.Index(tenors[0], name='tenor'),
+                                     columns=pd.Index(moneyness[0], name='moneyness'))
+    
+    def _surfaceArrays(self, dates:list[date], opt_prices:pd.DataFrame, spots:np.ndarray) -> tuple :
+        """
+        Implied vols of (dates x codes) prices arranged as a
+        (dates x maturities x strikes) cube with its tenor and moneyness axes
+        """
+        c_p, K, maturity = [np.array(x) for x in zip(*[SPYOption.parse(code) for code in opt_prices.columns])]
+        maturities = np.unique(maturity)
+        strikes = np.unique(K)
+        i_mat = np.searchsorted(maturities, maturity)
+        i_strike = np.searchsorted(strikes, K)
         
-        self._surface = table
\ No newline at end of file
+        _dates = np.array(dates, dtype='datetime64[D]')
+        t = (np.array(maturity, dtype='datetime64[D]')[None, :] - _dates[:, None]).astype(int) / 365
+        vol, converged = OptionBook.impliedVol(opt_prices.values, c_p[None, :], spots[:, None], K[None, :], SPY_r, t)
+        
+        # Prices that do not solve (or are missing) are left for the interpolator to fill
+        cube = np.full((len(dates), maturities.shape[0], strikes.shape[0]), np.nan)
+        cube[:, i_mat, i_strike] = np.where(converged, vol, np.nan)
+        tenors = np.round((np.array(maturities, dtype='datetime64[D]')[None, :] - _dates[:, None]).astype(int) / 365, 2)
+        moneyness = strikes[None, :] / spots[:, None] - 1
+        
+        return cube, tenors, moneyness
+    
+    def buildCube(self) :
+        """
+        Solves the surface of every date in the options history at once as a
+        (dates x tenors x moneyness) array, saved on disk and memory mapped
+        while the price histories, SPY_r and solver are unchanged
+        """
+        key = self._cubeKey()
+        file = FOLDER + '_data/spy_vol_cube'
+        
+        try :
+            with np.load(file + '.npz') as axes :
+                if str(axes['key']) == key :
+                    self._cubeDates = pd.Index([x.item() for x in axes['dates']])
+                    self._cubeTenors = axes['tenors']
+                    self._cubeMoneyness = axes['moneyness']
+                    self._cube = np.load(file + '.npy', mmap_mode='r')
+                    return
+        except (OSError, KeyError, ValueError) :
+            pass
+        
+        dates = self._opt_prices.index.tolist()
+        idx = self._spots.index.get_indexer(dates, method='nearest')
+        spots = self._spots.iloc[idx, 0].values
+        cube, tenors, moneyness = self._surfaceArrays(dates, self._opt_prices, spots)
+        
+        np.save(file + '.npy', cube)
+        np.savez(file + '.npz', key=key, dates=np.array(dates, dtype='datetime64[D]'),
+                 tenors=tenors, moneyness=moneyness)
+        self._cubeDates = pd.Index(dates)
+        self._cubeTenors = tenors
+        self._cubeMoneyness = moneyness
+        self._cube = np.load(file + '.npy', mmap_mode='r')
+    
+    def _cubeKey(self) -> str :
+        # Any change in the histories, the rate the cube is solved with or the solver invalidates the cache
+        h = hashlib.sha1(f'{CUBE_version}|{SPY_r!r}'.encode())
+        for history in [self._opt_prices, self._spots] :
+            h.update(pd.util.hash_pandas_object(history.reset_index()).values.tobytes())
+        
+        return h.hexdigest()
+    
+    @property
+    def cube(self) :
+        return self._cube